@@ -0,0 +1,31 @@
+"""
+Data model attribute access, method lookup and construction. Run from the
+repository root with `python -m benchmarks.models`.
+"""
+import timeit
+from typing import Dict
+
+from discordbot.backend.db.bases import QuizBase, UserBase
+
+
+def benchmark(number: int = 200000) -> Dict[str, float]:
+    """
+    Nanoseconds per data model attribute access, method lookup and model
+    construction.
+    """
+    user = UserBase()
+    timings = {
+        "attribute_get_ns": lambda: user.name,
+        "attribute_set_ns": lambda: setattr(user, "name", "name"),
+        "method_lookup_ns": lambda: user.add_messages,
+        "new_user_ns": UserBase,
+        "new_quiz_ns": QuizBase,
+    }
+    return {
+        name: timeit.timeit(func, number=number) / number * 1e9
+        for name, func in timings.items()
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,56 @@
+"""
+Chart rendering throughput and how long it blocks the event loop. Run from
+the repository root with `python -m benchmarks.render`.
+"""
+import asyncio
+import time
+from typing import Dict
+
+from discordbot.bot.lolapi.render import ChartRenderer
+
+
+async def benchmark(
+    renders: int = 100, champions: int = 150
+) -> Dict[str, float]:
+    """
+    Render throughput of the pool, and the longest the event loop was blocked
+    while rendering (measured by a ticker that should wake every 1 ms).
+    """
+    names = [f"Champion {i}" for i in range(champions)]
+    points = [(i * 7919) % 500000 for i in range(champions)]
+    renderer = ChartRenderer(max_pending=renders)
+    renderer.start()
+    await renderer.wait_warm()
+
+    longest_block = 0.0
+    running = True
+
+    async def ticker() -> None:
+        nonlocal longest_block
+        last = time.perf_counter()
+        while running:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            longest_block = max(longest_block, now - last - 0.001)
+            last = now
+
+    ticking = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            renderer.render_masteries(names, points, "Benchmark")
+            for _ in range(renders)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    running = False
+    await ticking
+    await renderer.close()
+    return {
+        "renders_per_second": renders / elapsed,
+        "longest_loop_block_ms": longest_block * 1000,
+    }
+
+
+if __name__ == "__main__":
+    print(asyncio.run(benchmark()))
@@ -1,2 +1,12 @@
 # flake8: noqa
-from .bot import BotClient
+from typing import Any
+
+
+def __getattr__(name: str) -> Any:
+    # Imported lazily so processes that only need a leaf module, like the
+    # chart rendering workers, do not load the whole bot
+    if name == "BotClient":
+        from .bot import BotClient
+
+        return BotClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,3 +1,5 @@
 # flake8: noqa
 from .bases import BaseDB
 from .firestore import FirestoreDB
+from .memory import MemoryDB
+from .sqlite import SQLiteDB
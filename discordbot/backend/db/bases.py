@@ -1,30 +1,115 @@
-from copy import deepcopy
-from typing import Any, Callable, Dict, List
+import functools
+import random
+from copy import copy, deepcopy
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
+from .buffers import UserHistoryBuffer
+from .censor import CensorMatcher
 
-class BaseDB:
-    # Transaction function wrapper
 
-    def __init__(self, callback: Callable[[str, Any], None]) -> None:
-        self.transactional: Callable[[Callable], Any]
+def no_transaction(
+    func: Callable[..., Awaitable[Any]]
+) -> Callable[..., Awaitable[Any]]:
+    """
+    Transaction function wrapper for backends without transactions, which
+    just runs `func` once with whatever `transaction()` returned.
+    """
+
+    @functools.wraps(func)
+    async def wrapped(transaction: Any, *args: Any, **kwargs: Any) -> Any:
+        return await func(transaction, *args, **kwargs)
+
+    return wrapped
+
+
+class BaseDB:
+    def __init__(
+        self,
+        callback: Callable[[str, Any], None],
+        *,
+        history_max_staleness: Optional[float] = None,
+        history_batch_size: int = 10,
+    ) -> None:
+        # Transaction function wrapper, replaced by backends with
+        # transactions
+        self.transactional: Callable[[Callable], Any] = no_transaction
+        # Message history is written through unless a maximum staleness is
+        # given, in which case appends are buffered and written behind
+        self.history_buffer: Optional[UserHistoryBuffer] = None
+        if history_max_staleness is not None:
+            self.history_buffer = UserHistoryBuffer(
+                self.flush_user_history,
+                max_size=history_batch_size,
+                max_staleness=history_max_staleness,
+            )
 
     def transaction(self) -> Any:
-        pass
+        # Passed to functions wrapped by `transactional`
+        return None
+
+    async def close(self) -> None:
+        if self.history_buffer is not None:
+            await self.history_buffer.close()
 
     async def censor_list(self) -> List[str]:
         return []
 
+    async def censor_match(self, content: str) -> Optional[str]:
+        # Returns a censored term found in the content, if any
+        return CensorMatcher(await self.censor_list()).find(content)
+
     async def get_user(self, user_id: int, **kwargs) -> "UserBase":
         user = UserBase()
         user.id = str(user_id)
         return user
 
+    async def add_user_message(
+        self, user: "UserBase", message: Dict[str, Any], **kwargs
+    ) -> None:
+        if self.history_buffer is None:
+            user.add_messages([message])
+            await user.commit(**kwargs)
+            return
+        # The name is carried along as it is updated on every message
+        self.history_buffer.append(user.id, user.name, message)
+
+    async def flush_user_history(
+        self,
+        user_id: str,
+        name: Optional[str],
+        messages: List[Dict[str, Any]],
+    ) -> None:
+        transaction = self.transaction()
+
+        @self.transactional
+        async def flush(t: Any) -> None:
+            user = await self.get_user(user_id, transaction=t)
+            if name is not None:
+                user.name = name
+            user.add_messages(messages)
+            await user.commit(transaction=t)
+
+        await flush(transaction)
+
     async def quiz_subjects(self) -> List[str]:
         return []
 
     async def quiz_list(self, subject: str) -> List[str]:
         return []
 
+    async def quiz_random(self, subject: str) -> Optional[str]:
+        quizzes = await self.quiz_list(subject)
+        return random.choice(quizzes) if quizzes else None
+
     async def get_quiz(self, subject: str, name: str) -> "QuizBase":
         return QuizBase()
 
@@ -35,49 +120,152 @@ class BaseDB:
         return counter
 
 
-class BaseDataModel:
-    _DEFAULT = {}
+class FieldChange:
+    """
+    Record of how a data model field changed since it was loaded, so that only
+    the change has to be written back. Either the whole value is replaced or
+    elements are added to/removed from an array, or a number is incremented.
+    Like Firestore's ArrayRemove, removing only matches stored elements that
+    are exactly equal, so removed dicts must be the elements as loaded.
+    """
+
+    __slots__ = ("replace", "union", "remove", "increment")
 
     def __init__(self) -> None:
-        # Deepcopy required because mutable datatypes are allowed as values
-        self._data: Dict[str, Any] = deepcopy(self._DEFAULT)
-
-    def __getattribute__(self, name: str) -> Any:
-        try:
-            _data = super().__getattribute__("_data")
-        except AttributeError:
-            # Class has not yet been initialised; stay out of the way for now
-            return super().__getattribute__(name)
-        if name not in _data:
-            try:
-                # Fallback to finding method attribute
-                return super().__getattribute__(name)
-            except AttributeError:
-                raise AttributeError(
-                    f"Data model '{self.__class__.__name__}' has no attribute "
-                    f"'{name}'"
-                )
-        return _data[name]
-
-    def __setattr__(self, name: str, value: Any) -> None:
-        if name == "_data":
-            return super().__setattr__(name, value)
-        if name not in self._DEFAULT:
-            return super().__setattr__(name, value)
-        expected_type = type(self._DEFAULT[name])
-        if not isinstance(value, expected_type):
+        self.replace = False
+        self.union: List[Any] = []
+        self.remove: List[Any] = []
+        self.increment: Union[int, float] = 0
+
+
+class Field:
+    """
+    Typed descriptor for a data model attribute, backed by the model's `_data`
+    dictionary. Generated for every key of a model's `_DEFAULT` schema.
+    Mutable values are copied (shallowly) the first time they are read, so
+    that mutating them in place can be detected when committing.
+    """
+
+    __slots__ = ("name", "type", "mutable")
+
+    def __init__(self, name: str, default: Any) -> None:
+        self.name = name
+        self.type = type(default)
+        self.mutable = isinstance(default, (dict, list, set))
+
+    def __get__(self, obj: Optional["BaseDataModel"], objtype: Any = None):
+        if obj is None:
+            return self
+        value = obj._data[self.name]
+        if self.mutable and self.name not in obj._loaded:
+            obj._loaded[self.name] = copy(value)
+        return value
+
+    def __set__(self, obj: "BaseDataModel", value: Any) -> None:
+        if not isinstance(value, self.type):
             raise TypeError(
-                f"Data model attribute '{self.__class__.__name__}.{name}' "
-                f"must be of type '{expected_type.__name__}' but got type "
+                f"Data model attribute '{obj.__class__.__name__}.{self.name}' "
+                f"must be of type '{self.type.__name__}' but got type "
                 f"'{type(value)}'"
             )
-        self._data[name] = value
+        obj._data[self.name] = value
+        obj._change(self.name).replace = True
+
+
+class BaseDataModel:
+    __slots__ = ("_data", "_changes", "_loaded")
+
+    _DEFAULT = {}
+    # Keys of `_DEFAULT` with mutable values, which need copying per instance
+    _MUTABLE: Tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if "_DEFAULT" not in cls.__dict__:
+            return
+        for name, default in cls._DEFAULT.items():
+            setattr(cls, name, Field(name, default))
+        cls._MUTABLE = tuple(
+            name
+            for name, default in cls._DEFAULT.items()
+            if isinstance(default, (dict, list, set))
+        )
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Any] = dict(self._DEFAULT)
+        # Deepcopy required because mutable datatypes are allowed as values
+        for name in self._MUTABLE:
+            self._data[name] = deepcopy(self._DEFAULT[name])
+        # Changes since the data was loaded or last committed. Assigning to a
+        # field replaces it and the helpers below add to or remove from it.
+        # Other in place mutations (e.g. `messages.append`) are found by
+        # `_collect_changes` and replace the field.
+        self._changes: Dict[str, FieldChange] = {}
+        # Copies of mutable fields as first read since loading or committing
+        self._loaded: Dict[str, Any] = {}
+
+    def _change(self, name: str) -> FieldChange:
+        change = self._changes.get(name)
+        if change is None:
+            change = self._changes[name] = FieldChange()
+        return change
+
+    def _collect_changes(self) -> Dict[str, FieldChange]:
+        """
+        The changes to write when committing. Fields that were mutated in
+        place beyond what the helpers tracked are marked as replaced. Only
+        the elements themselves are compared, not their order, and elements
+        nested inside them are not copied, so mutate those by replacing the
+        element instead.
+        """
+        for name, loaded in self._loaded.items():
+            change = self._changes.get(name)
+            if change is not None and change.replace:
+                continue
+            value = self._data[name]
+            if not isinstance(value, list):
+                if value != loaded:
+                    self._change(name).replace = True
+                continue
+            expected = loaded
+            if change is not None:
+                expected = [x for x in loaded if x not in change.remove]
+                expected += [x for x in change.union if x not in expected]
+            if len(value) != len(expected) or any(
+                x not in expected for x in value
+            ):
+                self._change(name).replace = True
+        # Copied again when next read
+        self._loaded.clear()
+        return self._changes
+
+    def array_union(self, name: str, items: List[Any]) -> None:
+        # Same semantics as Firestore: only adds items not already present
+        array = self._data[name]
+        for item in items:
+            if item not in array:
+                array.append(item)
+        self._change(name).union.extend(items)
+
+    def array_remove(self, name: str, items: List[Any]) -> None:
+        self._data[name] = [x for x in self._data[name] if x not in items]
+        self._change(name).remove.extend(items)
+
+    def increment(self, name: str, amount: Union[int, float]) -> None:
+        self._data[name] += amount
+        self._change(name).increment += amount
 
     async def commit(self, **kwargs) -> None:
-        pass
+        self._changes.clear()
+        self._loaded.clear()
 
 
 class UserBase(BaseDataModel):
+    __slots__ = ()
+
+    # Number of messages kept in the message history
+    HISTORY_LENGTH = 10
+
     _DEFAULT = {
         "id": "0",
         "name": "",
@@ -92,8 +280,27 @@ class UserBase(BaseDataModel):
         self.censor_exempt: bool
         self.messages: List[str]
 
+    def add_messages(self, messages: List[Dict[str, Any]]) -> None:
+        # Make sure messages are sorted by timestamp; timestamps are in ISO
+        # format YYYY-MM-DDTHH:MM:SS.mmmmmm+HH:MM. Time offsets are identical
+        # for all messages in the list so we can sort lexicographically.
+        ordered = sorted(
+            self.messages + messages, key=lambda x: x["timestamp"]
+        )
+        kept = {id(m) for m in ordered[-self.HISTORY_LENGTH :]}
+        # Only write the messages that were trimmed and added
+        removed = [m for m in self.messages if id(m) not in kept]
+        added = [m for m in messages if id(m) in kept]
+        if removed:
+            self.array_remove("messages", removed)
+        if added:
+            self.array_union("messages", added)
+        self.messages.sort(key=lambda x: x["timestamp"])
+
 
 class QuizBase(BaseDataModel):
+    __slots__ = ()
+
     # Demonstration of how quizzes can be laid out
     _DEFAULT = {
         "id": "",
@@ -132,6 +339,8 @@ class QuizBase(BaseDataModel):
 
 
 class MessageBase(BaseDataModel):
+    __slots__ = ()
+
     _DEFAULT = {
         "id": "",
         "author": "",
@@ -148,6 +357,8 @@ class MessageBase(BaseDataModel):
 
 
 class CounterBase(BaseDataModel):
+    __slots__ = ()
+
     _DEFAULT = {
         "name": "",
         "value": 0,
@@ -157,3 +368,4 @@ class CounterBase(BaseDataModel):
         super().__init__()
         self.name: str
         self.value: int
+
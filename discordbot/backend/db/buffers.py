@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+
+class _PendingHistory:
+    __slots__ = ("name", "messages", "handle", "failures")
+
+    def __init__(self, handle: asyncio.TimerHandle) -> None:
+        self.name: Optional[str] = None
+        self.messages: List[Dict[str, Any]] = []
+        self.handle = handle
+        # Flushes of these messages that failed in a row
+        self.failures = 0
+
+
+class UserHistoryBuffer:
+    """
+    Write-behind buffer for user message history. Appends are collected in
+    memory and written with one flush per user once either `max_size` messages
+    are pending or the oldest pending message is `max_staleness` seconds old,
+    so write volume scales with active users rather than with messages.
+    Failed flushes are retried after `retry_delay` seconds, doubling with
+    every failure in a row up to a minute.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[str, Optional[str], List[Dict[str, Any]]], Awaitable],
+        *,
+        max_size: int = 10,
+        max_staleness: float = 5.0,
+        retry_delay: float = 1.0,
+    ) -> None:
+        self._flush = flush
+        self.max_size = max_size
+        self.max_staleness = max_staleness
+        self.retry_delay = retry_delay
+        self._pending: Dict[str, _PendingHistory] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def append(
+        self, user_id: str, name: Optional[str], message: Dict[str, Any]
+    ) -> None:
+        self._add(user_id, name, [message])
+
+    def _add(
+        self,
+        user_id: str,
+        name: Optional[str],
+        messages: List[Dict[str, Any]],
+        *,
+        flush_full: bool = True,
+    ) -> None:
+        pending = self._pending.get(user_id)
+        if pending is None:
+            handle = asyncio.get_running_loop().call_later(
+                self.max_staleness, self._schedule, user_id
+            )
+            pending = self._pending[user_id] = _PendingHistory(handle)
+        if name is not None:
+            pending.name = name
+        pending.messages.extend(messages)
+        if flush_full and len(pending.messages) >= self.max_size:
+            self._schedule(user_id)
+
+    def _schedule(self, user_id: str) -> None:
+        task = asyncio.ensure_future(self.flush(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, user_id: Optional[str] = None) -> None:
+        if user_id is None:
+            await asyncio.gather(*(self.flush(u) for u in list(self._pending)))
+            return
+        pending = self._pending.pop(user_id, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        try:
+            await self._flush(user_id, pending.name, pending.messages)
+        except Exception as e:
+            # Keep the messages around, along with any that came in since,
+            # and retry them with backoff
+            print(f"Flushing message history of {user_id} failed on {e}")
+            # Names of messages that came in since are newer
+            name = None if user_id in self._pending else pending.name
+            self._add(user_id, name, pending.messages, flush_full=False)
+            retry = self._pending[user_id]
+            retry.failures = pending.failures + 1
+            retry.handle.cancel()
+            retry.handle = asyncio.get_running_loop().call_later(
+                min(self.retry_delay * 2 ** (retry.failures - 1), 60.0),
+                self._schedule,
+                user_id,
+            )
+
+    async def close(self) -> None:
+        # Wait for flushes already in flight, then flush everything left
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pending in self._pending.values():
+            pending.handle.cancel()
+        pending_items = list(self._pending.items())
+        self._pending.clear()
+        for user_id, pending in pending_items:
+            try:
+                await self._flush(user_id, pending.name, pending.messages)
+            except Exception as e:
+                print(f"Flushing message history of {user_id} failed on {e}")
@@ -0,0 +1,69 @@
+from typing import Dict, Iterable, List, Optional
+
+
+class CensorMatcher:
+    """
+    Aho-Corasick automaton over a list of censored terms. Finding whether a
+    message contains any of the terms takes time linear in the length of the
+    message regardless of how many terms there are. Matchers are immutable
+    once built so they can be swapped in atomically when the list changes.
+    """
+
+    def __init__(self, terms: Iterable[str]) -> None:
+        # Node 0 is the root. Each node has its transitions, its failure link
+        # and the term found when reaching it (either ending at the node or at
+        # one of the nodes along its failure links).
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[str]] = [None]
+        self._match_all: Optional[str] = None
+
+        for term in terms:
+            if not term:
+                # Empty strings are contained in every message
+                self._match_all = term
+                continue
+            node = 0
+            for char in term:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                node = nxt
+            if self._out[node] is None:
+                self._out[node] = term
+
+        # Breadth first so failure links of shallower nodes are already known
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[nxt] = fail if fail != nxt else 0
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> Optional[str]:
+        """
+        Returns a censored term contained in `text`, or None if there is none.
+        """
+        if self._match_all is not None:
+            return self._match_all
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
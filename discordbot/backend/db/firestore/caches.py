@@ -1,7 +1,21 @@
 import asyncio
+import itertools
+import random
+import threading
 from copy import deepcopy
-from typing import Any, Dict, List, Optional, Set
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
+from cachetools import LRUCache, TTLCache
 from google.cloud.firestore import (
     CollectionReference,
     DocumentReference,
@@ -9,27 +23,133 @@ from google.cloud.firestore import (
 )
 
 
+def freeze(value: Any) -> Any:
+    """
+    Returns a read-only version of document data: dicts become mapping proxies
+    and lists become tuples, all the way down.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """
+    Returns a mutable deep copy of data returned by `freeze`.
+    """
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+class SnapshotEvent:
+    """
+    Event set from snapshot listener threads and awaited on the event loop.
+    Waiters are woken through `call_soon_threadsafe` on their own loop instead
+    of polling. The event can also be set with an error, which is then raised
+    in every waiter until the event is set again without one.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._set = False
+        self._error: Optional[BaseException] = None
+        self._waiters: List[
+            Tuple[asyncio.AbstractEventLoop, asyncio.Future]
+        ] = []
+
+    def is_set(self) -> bool:
+        return self._set
+
+    def set(self, error: Optional[BaseException] = None) -> None:
+        # Can be called from any thread. Once set without an error, later
+        # errors are ignored as there is good data to serve.
+        with self._lock:
+            if self._set and self._error is None:
+                return
+            self._set = True
+            self._error = error
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._wake, future, error)
+
+    @staticmethod
+    def _wake(
+        future: asyncio.Future, error: Optional[BaseException]
+    ) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            if self._set:
+                future = None
+                error = self._error
+            else:
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+        if future is None:
+            if error is not None:
+                raise error
+            return
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                f"Timed out after {timeout}s waiting for {self.name}"
+            )
+        finally:
+            # Not woken, e.g. timed out or cancelled
+            if not future.done() or future.cancelled():
+                with self._lock:
+                    if (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+
+
 class DocumentCache:
     """
     Cache for a single document by implementing a snapshot listener. It is
-    recommended by Google to avoid too many snapshot listeners.
+    recommended by Google to avoid too many snapshot listeners. The document
+    is frozen once per snapshot so readers can share it without copying.
     """
 
     def __init__(
         self,
         document_ref_sync: DocumentReference,
+        on_update: Optional[Callable[[Mapping[str, Any]], None]] = None,
+        *,
+        timeout: float = 10.0,
     ) -> None:
         self.ref_sync = document_ref_sync
-        self._data: Dict[str, Any] = {}
+        self._data: Optional[Mapping[str, Any]] = MappingProxyType({})
+        self.timeout = timeout
+        self.loaded = SnapshotEvent(f"document {self.ref_sync.path}")
+        # Called from the listener thread with every new version of the data
+        self.on_update = on_update
         # Nothing to gain from loading lazily
         self.watch = self.ref_sync.on_snapshot(self.on_snapshot)
 
     def __del__(self) -> None:
         self.watch.unsubscribe()
 
-    async def get_dict(self) -> Optional[Dict[str, Any]]:
-        # Make this a coroutine for consistency
-        return deepcopy(self._data)
+    async def get_dict(self) -> Optional[Mapping[str, Any]]:
+        # Wait for the first snapshot so we never serve an empty document
+        await self.loaded.wait(self.timeout)
+        # Read-only and shared between callers; use `get_dict_copy` to mutate
+        return self._data
+
+    async def get_dict_copy(self) -> Optional[Dict[str, Any]]:
+        return thaw(await self.get_dict())
 
     def on_snapshot(
         self, doc_snapshot: DocumentSnapshot, changes: Any, read_time: Any
@@ -37,7 +157,16 @@ class DocumentCache:
         # For some reasaon `doc_snapshot` can be a list [doc_snapshot]
         if isinstance(doc_snapshot, list):
             doc_snapshot = doc_snapshot[0]
-        self._data = doc_snapshot.to_dict()
+        try:
+            # Swap in a fully built snapshot for readers on other threads
+            self._data = freeze(doc_snapshot.to_dict())
+            if self.on_update is not None:
+                self.on_update(self._data)
+        except Exception as e:
+            # Don't leave anyone waiting on a first snapshot that broke
+            self.loaded.set(e)
+            raise
+        self.loaded.set()
 
 
 class IndexCache:
@@ -45,50 +174,169 @@ class IndexCache:
     Cache for Firestore clients, automatically maintaining a list of document
     ids under a collection in an efficient manner by implementing a snapshot
     listener. It is recommended by Google to avoid too many snapshot listeners.
-    This does not maintain a record of the actual data stored in the documents
-    to reduce memory cost.
+    The ids are kept in a list with a position lookup so a random id can be
+    picked and ids added or removed in constant time. Documents delivered by
+    the listener are kept in a bounded LRU cache rather than all in memory.
     """
 
     def __init__(
         self,
         collection_ref_sync: CollectionReference,
+        *,
+        timeout: float = 10.0,
+        cache_size: int = 256,
     ) -> None:
         # Do not update immediately - load lazily
         # If we are never called, we can potentially avoid many reads
         # If we are called and there are few documents, we don't use many reads
         # either
         self.ref_sync = collection_ref_sync
-        self.loaded = False
-        self._index: Set[str] = set()
+        self.timeout = timeout
+        self.loaded = SnapshotEvent(f"collection {self.ref_sync.id}")
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._documents: LRUCache = LRUCache(cache_size)
+        # The snapshot listener runs on another thread
+        self._lock = threading.Lock()
 
     def __del__(self) -> None:
         # Not sure if required but literally nothing to lose from this
         if hasattr(self, "watch"):
             self.watch.unsubscribe()
 
-    async def get_document_ids(self) -> List[str]:
-        if self.loaded:
-            return list(self._index)
-        # Start listening for updates
-        self.start_watch()
+    async def wait_loaded(self) -> None:
+        if self.loaded.is_set():
+            return
+        # Start listening for updates, once for all concurrent callers
+        if not hasattr(self, "watch"):
+            self.start_watch()
         # Wait for the first on_snapshot call to complete. The first call will
         # contain all documents.
-        while not self.loaded:
-            await asyncio.sleep(0.1)
-        return list(self._index)
+        await self.loaded.wait(self.timeout)
+
+    async def get_document_ids(self) -> List[str]:
+        await self.wait_loaded()
+        with self._lock:
+            return list(self._ids)
+
+    async def random_document_id(self) -> Optional[str]:
+        await self.wait_loaded()
+        with self._lock:
+            if not self._ids:
+                return None
+            return random.choice(self._ids)
+
+    def get_document(self, doc_id: str) -> Optional[Mapping[str, Any]]:
+        # Frozen, use `thaw` for a mutable copy
+        with self._lock:
+            return self._documents.get(doc_id)
+
+    def put_document(self, doc_id: str, data: Dict[str, Any]) -> None:
+        data = freeze(data)
+        with self._lock:
+            self._documents[doc_id] = data
 
     def on_snapshot(
         self, col_snapshot: Any, changes: Any, read_time: Any
     ) -> None:
-        for change in changes:
-            if change.type.name == "ADDED":
-                self._index.add(change.document.id)
-            if change.type.name == "REMOVED":
-                try:
-                    self._index.remove(change.document.id)
-                except KeyError:
-                    pass
-        self.loaded = True
+        with self._lock:
+            for change in changes:
+                doc_id = change.document.id
+                if change.type.name == "REMOVED":
+                    self._remove(doc_id)
+                    self._documents.pop(doc_id, None)
+                    continue
+                if change.type.name == "ADDED":
+                    self._add(doc_id)
+                # The listener has already paid for reading the document
+                self._documents[doc_id] = freeze(change.document.to_dict())
+        self.loaded.set()
+
+    def _add(self, doc_id: str) -> None:
+        if doc_id not in self._positions:
+            self._positions[doc_id] = len(self._ids)
+            self._ids.append(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        position = self._positions.pop(doc_id, None)
+        if position is None:
+            return
+        # Move the last id into the gap
+        last = self._ids.pop()
+        if last != doc_id:
+            self._ids[position] = last
+            self._positions[last] = position
 
     def start_watch(self) -> None:
         self.watch = self.ref_sync.on_snapshot(self.on_snapshot)
+
+
+class UserCache:
+    """
+    Bounded read-through cache of user documents. Entries are evicted least
+    recently used first, expire after `ttl` seconds and are dropped whenever we
+    commit to the user ourselves. Users written in a transaction are not
+    cached again until it has committed, and reads that raced a write are
+    never cached, so a stale document can't linger for the whole TTL.
+    """
+
+    def __init__(self, *, maxsize: int = 1024, ttl: float = 60.0) -> None:
+        self._cache: TTLCache = TTLCache(maxsize, ttl)
+        # Bumped on every write to a user, see `version`
+        self._versions: LRUCache = LRUCache(maxsize * 4)
+        self._writes = itertools.count(1)
+        # Users with writes in transactions that have not committed yet
+        self._pending: Dict[Any, Set[str]] = {}
+        self._writing: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._cache.get(user_id)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Data models mutate their data in place
+        return deepcopy(data)
+
+    def version(self, user_id: str) -> int:
+        # Taken before reading a user from Firestore and passed to `put`
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def put(self, user_id: str, data: Dict[str, Any], version: int) -> None:
+        data = deepcopy(data)
+        with self._lock:
+            if (
+                user_id in self._writing
+                or self._versions.get(user_id, 0) != version
+            ):
+                return
+            self._cache[user_id] = data
+
+    def invalidate(self, user_id: str, transaction: Any = None) -> None:
+        # With a transaction, the user stays uncached until `release`
+        with self._lock:
+            self._cache.pop(user_id, None)
+            self._versions[user_id] = next(self._writes)
+            if transaction is None:
+                return
+            pending = self._pending.setdefault(transaction, set())
+            if user_id not in pending:
+                pending.add(user_id)
+                self._writing[user_id] = self._writing.get(user_id, 0) + 1
+
+    def release(self, transaction: Any) -> None:
+        # Called once the transaction has committed or failed for good
+        with self._lock:
+            for user_id in self._pending.pop(transaction, ()):
+                self._cache.pop(user_id, None)
+                self._versions[user_id] = next(self._writes)
+                if self._writing[user_id] > 1:
+                    self._writing[user_id] -= 1
+                else:
+                    del self._writing[user_id]
+
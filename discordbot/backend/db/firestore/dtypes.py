@@ -1,35 +1,83 @@
-from copy import deepcopy
-from typing import Any, Dict
+import random
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
 
 from google.api_core.exceptions import NotFound
-from google.cloud.firestore import AsyncDocumentReference, AsyncTransaction
+from google.cloud.firestore import (
+    ArrayRemove,
+    ArrayUnion,
+    AsyncClient,
+    AsyncDocumentReference,
+    AsyncTransaction,
+    Increment,
+)
 
 from ..bases import BaseDataModel, CounterBase, MessageBase, QuizBase, UserBase
 
+if TYPE_CHECKING:
+    from .caches import UserCache
+
 
 class CommitManager:
     def __init__(
-        self, data: BaseDataModel, document: AsyncDocumentReference
+        self,
+        data: BaseDataModel,
+        document: AsyncDocumentReference,
+        client: Optional[AsyncClient] = None,
     ) -> None:
         self.data = data
-        self._orig = deepcopy(data._data)
         self.document = document
+        self.client = client
+
+    def update(self) -> List[Dict[str, Any]]:
+        """
+        Turns the changes tracked by the data model into Firestore updates,
+        applied in order. A field can only appear once per update, so
+        elements removed from a field go in an update of their own ahead of
+        those added to it rather than rewriting the field in full.
+        """
+        removes: Dict[str, Any] = {}
+        update: Dict[str, Any] = {}
+        for path, change in self.data._collect_changes().items():
+            if change.replace:
+                update[path] = self.data._data[path]
+            elif change.increment:
+                update[path] = Increment(change.increment)
+            else:
+                if change.remove and change.union:
+                    removes[path] = ArrayRemove(change.remove)
+                elif change.remove:
+                    update[path] = ArrayRemove(change.remove)
+                if change.union:
+                    update[path] = ArrayUnion(change.union)
+        return [u for u in (removes, update) if u]
 
     async def commit(self, *, transaction: AsyncTransaction = None) -> None:
+        updates = self.update()
         try:
-            # Update diffs
-            diffs = {}
-            for k, v in self.data._data.items():
-                if k not in self._orig or self._orig[k] != v:
-                    diffs[k] = v
-            if diffs:
-                if transaction is not None:
+            if transaction is not None:
+                for update in updates:
                     # No await here
-                    transaction.update(self.document, diffs)
-                else:
-                    await self.document.update(diffs)
+                    transaction.update(self.document, update)
+            elif len(updates) > 1 and self.client is not None:
+                # Written together so the document is never seen in between
+                batch = self.client.batch()
+                for update in updates:
+                    batch.update(self.document, update)
+                await batch.commit()
+            else:
+                for update in updates:
+                    await self.document.update(update)
         except NotFound:
             await self.create()
+        self.data._changes.clear()
 
     async def create(
         self, *, transaction: AsyncDocumentReference = None
@@ -39,25 +87,39 @@ class CommitManager:
             transaction.set(self.document, self.data._data)
         else:
             await self.document.set(self.data._data)
+        self.data._changes.clear()
 
 
 class User(UserBase):
+    __slots__ = ("cm", "cache")
+
     def __init__(
-        self, data_dict: Dict[str, Any], document: AsyncDocumentReference
+        self,
+        data_dict: Dict[str, Any],
+        document: AsyncDocumentReference,
+        cache: Optional["UserCache"] = None,
+        client: Optional[AsyncClient] = None,
     ) -> None:
         super().__init__()
         data_dict = data_dict or {}
         self._data.update(data_dict)
-        self.cm = CommitManager(self, document)
+        self.cm = CommitManager(self, document, client)
+        self.cache = cache
 
     async def commit(self, *, transaction: AsyncTransaction = None) -> None:
         await self.cm.commit(transaction=transaction)
+        if self.cache is not None:
+            self.cache.invalidate(self.id, transaction)
 
     async def create(self, *, transaction: AsyncTransaction = None) -> None:
         await self.cm.create(transaction=transaction)
+        if self.cache is not None:
+            self.cache.invalidate(self.id, transaction)
 
 
 class Quiz(QuizBase):
+    __slots__ = ()
+
     def __init__(self, data_dict: Dict[str, Any]) -> None:
         super().__init__()
         data_dict = data_dict or {}
@@ -65,6 +127,8 @@ class Quiz(QuizBase):
 
 
 class Message(MessageBase):
+    __slots__ = ()
+
     def __init__(self, data_dict: Dict[str, Any]) -> None:
         super().__init__()
         data_dict = data_dict or {}
@@ -72,16 +136,106 @@ class Message(MessageBase):
 
 
 class Counter(CounterBase):
+    """
+    Counter whose value is spread over the documents of its `shards`
+    subcollection so concurrent increments don't all contend for one
+    document. The value of the counter is the sum of the shards, which never
+    go below zero. Increments are written blindly to a random shard; the
+    shards are only read to find the total, which is cached in `totals` by
+    counter name in between.
+    """
+
+    __slots__ = ("document", "shard_refs", "shard_values", "loaded", "totals")
+
     def __init__(
-        self, data_dict: Dict[str, Any], document: AsyncDocumentReference
+        self,
+        name: str,
+        document: AsyncDocumentReference,
+        shards: int,
+        totals: MutableMapping[str, int],
     ) -> None:
         super().__init__()
-        data_dict = data_dict or {}
-        self._data.update(data_dict)
-        self.cm = CommitManager(self, document)
+        self._data.update({"name": name, "shards": shards})
+        self.document = document
+        self.shard_refs = [
+            document.collection("shards").document(str(i))
+            for i in range(shards)
+        ]
+        # Values of the shards if they were read
+        self.shard_values: Optional[List[int]] = None
+        # Value as last read or committed
+        self.loaded = 0
+        self.totals = totals
+
+    def set_total(self, value: int) -> None:
+        self._data["value"] = self.loaded = value
+
+    async def load(
+        self, client: AsyncClient, *, transaction: AsyncTransaction = None
+    ) -> None:
+        snapshots = client.get_all(self.shard_refs, transaction=transaction)
+        values = {
+            snapshot.id: (snapshot.to_dict() or {}).get("value", 0)
+            async for snapshot in snapshots
+        }
+        self.set_shards(
+            [values.get(str(i), 0) for i in range(len(self.shard_refs))]
+        )
+        # Values read in a transaction may be about to change
+        if transaction is None:
+            self.totals[self.name] = self.value
+
+    def set_shards(self, values: List[int]) -> None:
+        self.shard_values = values
+        self.set_total(sum(values))
+
+    def distribute(self, delta: int) -> List[Tuple[int, int]]:
+        # Increments go to one random shard, decrements are taken from shards
+        # that have something left so none of them go below zero
+        start = random.randrange(len(self.shard_refs))
+        if delta >= 0:
+            return [(start, delta)]
+        if self.shard_values is None:
+            raise ValueError("Counter shards must be loaded to decrement")
+        deltas = []
+        for offset in range(len(self.shard_refs)):
+            i = (start + offset) % len(self.shard_refs)
+            take = min(-delta, self.shard_values[i])
+            if take > 0:
+                deltas.append((i, -take))
+                delta += take
+            if delta == 0:
+                break
+        return deltas
 
     async def commit(self, *, transaction: AsyncTransaction = None) -> None:
-        await self.cm.commit(transaction=transaction)
+        # The name and shard count never change, and the value is not a field
+        # of any one document, so only the difference is written to shards
+        self._changes.clear()
+        delta = self.value - self.loaded
+        for i, shard_delta in self.distribute(delta) if delta else []:
+            update = {"value": Increment(shard_delta)}
+            if transaction is not None:
+                # No await here
+                transaction.set(self.shard_refs[i], update, merge=True)
+            else:
+                await self.shard_refs[i].set(update, merge=True)
+            if self.shard_values is not None:
+                self.shard_values[i] += shard_delta
+        if transaction is not None:
+            # Not committed yet, so read the total again next time
+            self.totals.pop(self.name, None)
+        elif delta and self.name in self.totals:
+            # Concurrent increments each add to the cached total
+            self.totals[self.name] += delta
+            self._data["value"] = self.totals[self.name]
+        self.loaded = self.value
 
     async def create(self, *, transaction: AsyncTransaction = None) -> None:
-        await self.cm.create(transaction=transaction)
+        data = {"name": self.name, "shards": len(self.shard_refs)}
+        if transaction is not None:
+            # No await here
+            transaction.set(self.document, data)
+        else:
+            await self.document.set(data)
+        self._changes.clear()
@@ -1,24 +1,50 @@
-from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import functools
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
+from cachetools import TTLCache
 from google.cloud.firestore import (
+    DELETE_FIELD,
     AsyncClient,
     AsyncCollectionReference,
     AsyncQuery,
     AsyncTransaction,
     Client,
     CollectionReference,
+    Increment,
     async_transactional,
 )
 
 from ..bases import BaseDB, CounterBase, QuizBase, UserBase
-from .caches import DocumentCache, IndexCache
+from ..censor import CensorMatcher
+from .caches import DocumentCache, IndexCache, UserCache, thaw
 from .dtypes import Counter, Quiz, User
 from .fsms import FirestoreMessagingService
 
 
 class FirestoreDB(BaseDB):
-    def __init__(self, callback: Callable[[str, Any], None]) -> None:
-        self.transactional = async_transactional
+    def __init__(
+        self,
+        callback: Callable[[str, Any], None],
+        *,
+        user_cache_size: int = 1024,
+        user_cache_ttl: float = 60.0,
+        counter_shards: int = 8,
+        counter_cache_ttl: float = 60.0,
+        quiz_prefetch: Sequence[str] = (),
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(callback, **kwargs)
+        self.transactional = self.transactional_releasing
 
         self.callback = callback
         self.db = AsyncClient()
@@ -41,43 +67,134 @@ class FirestoreDB(BaseDB):
         # collection is extremely inefficient (Cloud read cost)
         self.quiz_cache: Dict[str, IndexCache] = {}
 
-        # Censor document cache
+        # Censor document cache, compiling the censor list whenever it changes
+        self.censor_matcher = CensorMatcher([])
         self.censor_cache = DocumentCache(
             self.db_sync.collection("config").document("censor"),
+            self.on_censor_update,
         )
 
         # Quiz index document cache
         self.quiz_index_cache = DocumentCache(self.quiz_index_sync)
+        # Kept so the task is not garbage collected before it is done
+        self.prefetching: Optional[asyncio.Task] = None
+        if quiz_prefetch:
+            self.prefetching = asyncio.get_running_loop().create_task(
+                self.prefetch_quizzes(quiz_prefetch)
+            )
+            self.prefetching.add_done_callback(self.prefetched_quizzes)
+
+        # User document cache as users are read on every message
+        self.user_cache = UserCache(
+            maxsize=user_cache_size, ttl=user_cache_ttl
+        )
+
+        # Counter name to document id and number of shards, as neither ever
+        # changes
+        self.counter_ids: Dict[str, Tuple[str, int]] = {}
+        # Counter name to its total as last read or written by us
+        self.counter_totals: TTLCache = TTLCache(1024, counter_cache_ttl)
+        # Number of shards new counters are spread over
+        self.counter_shards = counter_shards
 
         # Messaging service
         self.messaging_service = FirestoreMessagingService(
-            self.db_sync.collection("messaging"), self.callback
+            self.db_sync, self.db_sync.collection("messaging"), self.callback
         )
 
     def transaction(self) -> Any:
         return self.db.transaction()
 
+    def transactional_releasing(self, func: Callable) -> Callable:
+        # `async_transactional` that lets users written in the transaction
+        # be cached again once it has committed
+        wrapped = async_transactional(func)
+
+        @functools.wraps(func)
+        async def run(transaction: AsyncTransaction, *args, **kwargs) -> Any:
+            try:
+                return await wrapped(transaction, *args, **kwargs)
+            finally:
+                self.user_cache.release(transaction)
+
+        return run
+
+    async def close(self) -> None:
+        await super().close()
+        # Make sure handled messages are not delivered again on restart
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.messaging_service.close
+        )
+
     async def censor_list(self) -> List[str]:
-        return (await self.censor_cache.get_dict())["data"]
+        return list((await self.censor_cache.get_dict())["data"])
+
+    async def censor_match(self, content: str) -> Optional[str]:
+        # The matcher is empty until the first snapshot of the censor list
+        await self.censor_cache.loaded.wait(self.censor_cache.timeout)
+        return self.censor_matcher.find(content)
+
+    def on_censor_update(self, data: Optional[Mapping[str, Any]]) -> None:
+        # Build the new matcher before swapping it in so readers never see a
+        # partially built one
+        self.censor_matcher = CensorMatcher((data or {}).get("data", []))
 
     async def get_user(
         self, user_id: int, *, transaction: AsyncTransaction = None
     ) -> UserBase:
         ref = self.users.document(str(user_id))
+        # Transactional reads always go to Firestore so the transaction can
+        # detect conflicting writes
+        if transaction is None:
+            data = self.user_cache.get(str(user_id))
+            if data is not None:
+                return User(data, ref, self.user_cache, self.db)
+        version = self.user_cache.version(str(user_id))
         data = (await ref.get(transaction=transaction)).to_dict()
-        user = User(data, ref)
+        # Transactional reads may be about to be overwritten, so only other
+        # reads are cached
+        if data is not None and transaction is None:
+            self.user_cache.put(str(user_id), data, version)
+        user = User(data, ref, self.user_cache, self.db)
         if data is None:
             user.id = str(user_id)
             await user.create(transaction=transaction)
         return user
 
     async def quiz_subjects(self) -> List[str]:
-        return (await self.quiz_index_cache.get_dict())["subjects"]
+        return list((await self.quiz_index_cache.get_dict())["subjects"])
 
     async def quiz_list(self, subject: str) -> List[str]:
+        cache = await self.get_quiz_cache(subject)
+        if cache is None:
+            return []
+        return await cache.get_document_ids()
+
+    async def quiz_random(self, subject: str) -> Optional[str]:
+        cache = await self.get_quiz_cache(subject)
+        if cache is None:
+            return None
+        return await cache.random_document_id()
+
+    async def get_quiz(self, subject: str, name: str) -> QuizBase:
         res = await self.get_quiz_collection_by_subject(subject)
         if res is None:
-            return []
+            return QuizBase()
+        coll, _ = res
+        cache = await self.get_quiz_cache(subject)
+        data = cache.get_document(name)
+        if data is None:
+            data = (await coll.document(name).get()).to_dict()
+            if data is not None:
+                cache.put_document(name, data)
+            return Quiz(data)
+        # Quizzes are shuffled in place, so they need their own copy
+        return Quiz(thaw(data))
+
+    async def get_quiz_cache(self, subject: str) -> Optional[IndexCache]:
+        res = await self.get_quiz_collection_by_subject(subject)
+        if res is None:
+            return None
         coll, coll_sync = res
         # Don't let the cache take priority so live changes to /quizzes/index
         # are prioritised instead
@@ -85,15 +202,19 @@ class FirestoreDB(BaseDB):
         # are many-to-one
         if coll.id not in self.quiz_cache:
             self.quiz_cache[coll.id] = IndexCache(coll_sync)
-        return await self.quiz_cache[coll.id].get_document_ids()
+        return self.quiz_cache[coll.id]
 
-    async def get_quiz(self, subject: str, name: str) -> QuizBase:
-        coll, _ = await self.get_quiz_collection_by_subject(subject)
-        if coll is None:
-            return QuizBase()
-        data = await coll.document(name).get()
-        quiz = Quiz(data.to_dict())
-        return quiz
+    async def prefetch_quizzes(self, subjects: Sequence[str]) -> None:
+        # Start listening to popular subjects so their first quiz is served
+        # from memory
+        for subject in subjects:
+            cache = await self.get_quiz_cache(subject)
+            if cache is not None:
+                await cache.wait_loaded()
+
+    def prefetched_quizzes(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Prefetching quizzes failed on {task.exception()}")
 
     async def get_quiz_collection_by_subject(
         self, subject: str
@@ -108,14 +229,82 @@ class FirestoreDB(BaseDB):
     async def get_counter(
         self, name: str, *, transaction: AsyncTransaction = None
     ) -> CounterBase:
+        found = self.counter_ids.get(name)
+        if found is None and transaction is None:
+            # Look up (or create) the counter in a transaction so concurrent
+            # callers don't create duplicates. Only happens once per name.
+            @self.transactional
+            async def lookup(t: AsyncTransaction) -> CounterBase:
+                return await self.get_counter(name, transaction=t)
+
+            counter = await lookup(self.transaction())
+            self.counter_ids[name] = (
+                counter.document.id,
+                len(counter.shard_refs),
+            )
+            return counter
+        if found is None:
+            # Already loaded if anything was written, as Firestore does not
+            # allow reads after writes in a transaction
+            counter = await self.find_counter(name, transaction)
+        else:
+            counter_id, shards = found
+            counter = Counter(
+                name,
+                self.counters.document(counter_id),
+                shards,
+                self.counter_totals,
+            )
+        if counter.shard_values is not None:
+            return counter
+        total = self.counter_totals.get(name)
+        if transaction is not None or total is None:
+            await counter.load(self.db, transaction=transaction)
+        else:
+            counter.set_total(total)
+        return counter
+
+    async def find_counter(
+        self, name: str, transaction: AsyncTransaction
+    ) -> Counter:
         # Limit is unnecessary but just to be safe
-        query: AsyncQuery = self.counters.where("name", "==", name).limit(1)
-        documents = await query.get(transaction=transaction)
+        query: AsyncQuery = self.counters.where("name", "==", name)
+        documents = await query.limit(1).get(transaction=transaction)
         if not documents:
-            # Create a new counter
-            ref = self.counters.document()
-            counter = Counter({"name": name, "value": 0}, ref)
+            # Create a new counter, which starts at zero
+            counter = Counter(
+                name,
+                self.counters.document(),
+                self.counter_shards,
+                self.counter_totals,
+            )
+            counter.set_shards([0] * self.counter_shards)
             await counter.create(transaction=transaction)
             return counter
-
-        return Counter(documents[0].to_dict(), documents[0].reference)
+        document = documents[0]
+        data = document.to_dict()
+        shards = data.get("shards", self.counter_shards)
+        counter = Counter(
+            name, document.reference, shards, self.counter_totals
+        )
+        if "value" not in data:
+            if name not in self.counter_ids:
+                # Only cached here if nothing is written, otherwise once the
+                # transaction commits
+                self.counter_ids[name] = (document.id, shards)
+            return counter
+        # Counters used to keep (part of) their value in their own document,
+        # move it to the first shard. Every read comes before the writes.
+        await counter.load(self.db, transaction=transaction)
+        transaction.set(
+            counter.shard_refs[0],
+            {"value": Increment(data["value"])},
+            merge=True,
+        )
+        transaction.update(
+            document.reference, {"shards": shards, "value": DELETE_FIELD}
+        )
+        values = counter.shard_values
+        values[0] += data["value"]
+        counter.set_shards(values)
+        return counter
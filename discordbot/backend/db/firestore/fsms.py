@@ -1,40 +1,139 @@
-from typing import Any, Callable
-from google.cloud.firestore import CollectionReference
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from google.cloud.firestore import (
+    Client,
+    CollectionReference,
+    DocumentReference,
+    DocumentSnapshot,
+)
 
 from .dtypes import Message
 
+# Maximum number of operations in a Firestore batched write
+BATCH_LIMIT = 500
+
 
 class FirestoreMessagingService:
     """
     Listens to a collection for additions and sends them as message by
     implementing a snapshot listener. It is recommended by Google to avoid too
-    many snapshot listeners.
+    many snapshot listeners. Handled documents are deleted in batched writes
+    away from the listener thread. The listener only delivers a document once,
+    so documents whose callback failed are kept and retried every
+    `retry_interval` seconds.
     """
 
     def __init__(
         self,
+        client_sync: Client,
         collection_ref_sync: CollectionReference,
         callback: Callable[[str, Any], None],
+        *,
+        retry_interval: float = 5.0,
     ) -> None:
+        self.client_sync = client_sync
         self.ref_sync = collection_ref_sync
         self.callback = callback
+        self.retry_interval = retry_interval
+        self._deletes: List[DocumentReference] = []
+        # Documents whose callback failed by id, and the timer retrying them
+        self._failed: Dict[str, DocumentSnapshot] = {}
+        self._retry: Optional[threading.Timer] = None
+        self._closed = False
+        self._lock = threading.Lock()
+        # A single worker so flushes never race each other
+        self.executor = ThreadPoolExecutor(max_workers=1)
         self.watch = self.ref_sync.on_snapshot(self.on_snapshot)
 
     def __del__(self) -> None:
         self.watch.unsubscribe()
+        self.executor.shutdown(wait=False)
 
     def on_snapshot(
         self, col_snapshot: Any, changes: Any, read_time: Any
     ) -> None:
+        handled = []
+        failed = []
         for change in changes:
-            if change.type.name == "ADDED":
-                message = Message(change.document.to_dict())
-                self.callback(
-                    "message",
-                    {
-                        "target": message.target,
-                        "content": message.content,
-                    },
+            if change.type.name == "REMOVED":
+                # Deleted by someone else, so no need to retry it
+                with self._lock:
+                    self._failed.pop(change.document.id, None)
+            elif change.type.name == "ADDED":
+                if self.handle(change.document):
+                    handled.append(change.document.reference)
+                else:
+                    failed.append(change.document)
+        self.handled(handled, failed)
+
+    def handle(self, document: DocumentSnapshot) -> bool:
+        message = Message(document.to_dict())
+        try:
+            self.callback(
+                "message",
+                {"target": message.target, "content": message.content},
+            )
+        except Exception as e:
+            print(f"Messaging callback failed on {e}")
+            return False
+        return True
+
+    def handled(
+        self, handled: List[DocumentReference], failed: List[DocumentSnapshot]
+    ) -> None:
+        with self._lock:
+            for document in failed:
+                self._failed[document.id] = document
+            if self._failed and self._retry is None and not self._closed:
+                self._retry = threading.Timer(
+                    self.retry_interval, self.retry_failed
                 )
-                # Delete the document as we are done with it
-                change.document.reference.delete()
+                self._retry.daemon = True
+                self._retry.start()
+            # The callback has been handed off, so we are done with these
+            self._deletes.extend(handled)
+        if handled:
+            self.executor.submit(self.flush_deletes)
+
+    def retry_failed(self) -> None:
+        with self._lock:
+            documents = list(self._failed.values())
+            self._failed.clear()
+            self._retry = None
+        handled = []
+        failed = []
+        for document in documents:
+            if self.handle(document):
+                handled.append(document.reference)
+            else:
+                failed.append(document)
+        self.handled(handled, failed)
+
+    def flush_deletes(self) -> None:
+        with self._lock:
+            refs, self._deletes = self._deletes, []
+        for i in range(0, len(refs), BATCH_LIMIT):
+            chunk = refs[i : i + BATCH_LIMIT]
+            batch = self.client_sync.batch()
+            for ref in chunk:
+                batch.delete(ref)
+            try:
+                batch.commit()
+            except Exception as e:
+                # Retry with the next flush
+                print(f"Deleting handled messages failed on {e}")
+                with self._lock:
+                    self._deletes.extend(refs[i:])
+                return
+
+    def close(self) -> None:
+        # Blocks until every handled document has been deleted (or failed to)
+        self.watch.unsubscribe()
+        with self._lock:
+            self._closed = True
+            if self._retry is not None:
+                self._retry.cancel()
+        self.executor.submit(self.flush_deletes)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,90 @@
+from copy import deepcopy
+from typing import Any, Dict
+
+from ..bases import BaseDataModel, CounterBase, QuizBase, UserBase
+from .store import MemoryStore, MemoryTransaction, freeze_changes
+
+
+class CommitManager:
+    def __init__(
+        self,
+        data: BaseDataModel,
+        store: MemoryStore,
+        collection: str,
+        doc_id: str,
+    ) -> None:
+        self.data = data
+        self.store = store
+        self.collection = collection
+        self.doc_id = doc_id
+
+    def write(
+        self, operation: str, payload: Any, transaction: MemoryTransaction
+    ) -> None:
+        write = (self.collection, self.doc_id, operation, payload)
+        if transaction is not None:
+            transaction.write(write)
+        else:
+            self.store.commit([write])
+        self.data._changes.clear()
+
+    async def commit(self, *, transaction: MemoryTransaction = None) -> None:
+        if self.data._collect_changes():
+            changes = freeze_changes(self.data)
+            self.write(
+                "update", (changes, deepcopy(self.data._data)), transaction
+            )
+
+    async def create(self, *, transaction: MemoryTransaction = None) -> None:
+        self.write("set", deepcopy(self.data._data), transaction)
+
+
+class User(UserBase):
+    __slots__ = ("cm",)
+
+    def __init__(
+        self,
+        data_dict: Dict[str, Any],
+        store: MemoryStore,
+        doc_id: str,
+    ) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+        self.cm = CommitManager(self, store, "users", doc_id)
+
+    async def commit(self, *, transaction: MemoryTransaction = None) -> None:
+        await self.cm.commit(transaction=transaction)
+
+    async def create(self, *, transaction: MemoryTransaction = None) -> None:
+        await self.cm.create(transaction=transaction)
+
+
+class Quiz(QuizBase):
+    __slots__ = ()
+
+    def __init__(self, data_dict: Dict[str, Any]) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+
+
+class Counter(CounterBase):
+    __slots__ = ("cm",)
+
+    def __init__(
+        self,
+        data_dict: Dict[str, Any],
+        store: MemoryStore,
+        doc_id: str,
+    ) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+        self.cm = CommitManager(self, store, "counters", doc_id)
+
+    async def commit(self, *, transaction: MemoryTransaction = None) -> None:
+        await self.cm.commit(transaction=transaction)
+
+    async def create(self, *, transaction: MemoryTransaction = None) -> None:
+        await self.cm.create(transaction=transaction)
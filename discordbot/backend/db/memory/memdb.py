@@ -0,0 +1,137 @@
+import json
+import os
+from copy import deepcopy
+from typing import Any, Callable, Dict, List, Optional
+
+from ..bases import BaseDB, CounterBase, QuizBase, UserBase
+from ..censor import CensorMatcher
+from .dtypes import Counter, Quiz, User
+from .store import MemoryStore, MemoryTransaction, transactional
+
+
+class MemoryDB(BaseDB):
+    """
+    Database kept entirely in memory, laid out like the Firestore database.
+    Useful for running the bot locally and as a baseline for benchmarks. The
+    contents can optionally be persisted to a JSON file on close.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, Any], None],
+        *,
+        snapshot_path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(callback, **kwargs)
+        self.transactional = transactional
+
+        self.callback = callback
+        self.store = MemoryStore()
+        self.snapshot_path = snapshot_path
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            with open(snapshot_path) as fp:
+                self.store.load(json.load(fp))
+
+        # First time setup
+        if self.store.get("config", "censor")[1] is None:
+            self.put("config", "censor", {"data": []})
+        if self.store.get("quizzes", "index")[1] is None:
+            self.put("quizzes", "index", {"subjects": []})
+
+        # Compiled censor list and the version of the document it is from
+        self.censor_matcher = CensorMatcher([])
+        self.censor_version = -1
+
+        # Messaging service; documents are handled as soon as they are added
+        self.store.listeners["messaging"] = self.on_messaging_write
+
+    def transaction(self) -> MemoryTransaction:
+        return MemoryTransaction(self.store)
+
+    async def close(self) -> None:
+        await super().close()
+        if self.snapshot_path is not None:
+            self.save_snapshot()
+
+    def save_snapshot(self) -> None:
+        # Write to a temporary file first so a crash never leaves half a file
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self.store.dump(), fp)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def put(self, collection: str, doc_id: str, data: Dict[str, Any]) -> None:
+        # Write a document directly, e.g. to seed quizzes or send messages
+        self.store.commit([(collection, doc_id, "set", deepcopy(data))])
+
+    def read(
+        self,
+        collection: str,
+        doc_id: str,
+        transaction: Optional[MemoryTransaction] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if transaction is not None:
+            data = transaction.get(collection, doc_id)
+        else:
+            data = self.store.get(collection, doc_id)[1]
+        # Stored versions are shared, so hand out copies to be mutated
+        return deepcopy(data)
+
+    def on_messaging_write(
+        self, doc_id: str, data: Optional[Dict[str, Any]]
+    ) -> None:
+        if data is None:
+            return
+        self.callback(
+            "message",
+            {"target": data.get("target", ""), "content": data["content"]},
+        )
+        # Delete the document as we are done with it
+        self.store.commit([("messaging", doc_id, "delete", None)])
+
+    async def censor_list(self) -> List[str]:
+        return list(self.store.get("config", "censor")[1]["data"])
+
+    async def censor_match(self, content: str) -> Optional[str]:
+        version, data = self.store.get("config", "censor")
+        if version != self.censor_version:
+            self.censor_matcher = CensorMatcher(data["data"])
+            self.censor_version = version
+        return self.censor_matcher.find(content)
+
+    async def get_user(
+        self, user_id: int, *, transaction: MemoryTransaction = None
+    ) -> UserBase:
+        data = self.read("users", str(user_id), transaction)
+        user = User(data, self.store, str(user_id))
+        if data is None:
+            user.id = str(user_id)
+            await user.create(transaction=transaction)
+        return user
+
+    async def quiz_subjects(self) -> List[str]:
+        return list(self.store.get("quizzes", "index")[1]["subjects"])
+
+    async def quiz_list(self, subject: str) -> List[str]:
+        coll = self.store.get("quizzes", "index")[1].get(subject)
+        if coll is None:
+            return []
+        return self.store.list_ids(f"quizzes/index/{coll}")
+
+    async def get_quiz(self, subject: str, name: str) -> QuizBase:
+        coll = self.store.get("quizzes", "index")[1].get(subject)
+        if coll is None:
+            return QuizBase()
+        return Quiz(self.read(f"quizzes/index/{coll}", name))
+
+    async def get_counter(
+        self, name: str, *, transaction: MemoryTransaction = None
+    ) -> CounterBase:
+        # Counters are keyed by name, so no lookup is needed
+        data = self.read("counters", name, transaction)
+        if data is None:
+            counter = Counter({"name": name, "value": 0}, self.store, name)
+            await counter.create(transaction=transaction)
+            return counter
+        return Counter(data, self.store, name)
@@ -0,0 +1,258 @@
+import functools
+from copy import deepcopy
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+
+from ..bases import BaseDataModel
+
+# (collection, document id, operation, payload)
+Write = Tuple[str, str, str, Any]
+# Field name to (replace, value, union, remove, increment)
+Changes = Dict[str, Tuple[bool, Any, List[Any], List[Any], Any]]
+
+
+class TransactionConflict(Exception):
+    pass
+
+
+def freeze_changes(data: BaseDataModel) -> Changes:
+    # Copy the tracked changes so later mutations of the model don't leak in
+    return {
+        name: (
+            change.replace,
+            deepcopy(data._data[name]) if change.replace else None,
+            deepcopy(change.union),
+            deepcopy(change.remove),
+            change.increment,
+        )
+        for name, change in data._changes.items()
+    }
+
+
+def apply_changes(data: Dict[str, Any], changes: Changes) -> Dict[str, Any]:
+    # Stored documents are never mutated in place; changed fields get new
+    # objects and the rest are shared with the previous version
+    data = dict(data)
+    for name, (replace, value, union, remove, increment) in changes.items():
+        if replace:
+            data[name] = value
+            continue
+        if increment:
+            data[name] = data.get(name, 0) + increment
+        if remove:
+            data[name] = [x for x in data.get(name, []) if x not in remove]
+        if union:
+            array = list(data.get(name, []))
+            for item in union:
+                if item not in array:
+                    array.append(item)
+            data[name] = array
+    return data
+
+
+class _Document:
+    __slots__ = ("versions",)
+
+    def __init__(self) -> None:
+        # (version, data) in commit order; data is None once deleted
+        self.versions: List[Tuple[int, Optional[Dict[str, Any]]]] = []
+
+    def latest(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        return self.versions[-1] if self.versions else (0, None)
+
+    def at(self, version: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        for entry in reversed(self.versions):
+            if entry[0] <= version:
+                return entry
+        return 0, None
+
+
+class MemoryStore:
+    """
+    Multi-version document store. Every commit creates a new version of the
+    documents it writes, and older versions are kept for as long as a
+    transaction that started before the commit is still running, so each
+    transaction reads from a consistent snapshot.
+    """
+
+    def __init__(self) -> None:
+        self.collections: Dict[str, Dict[str, _Document]] = {}
+        self.version = 0
+        # Snapshot versions of running transactions and how many use them
+        self._active: Dict[int, int] = {}
+        # Called with (document id, data) after a document in the collection
+        # is written; data is None when it was deleted
+        self.listeners: Dict[str, Callable[[str, Optional[Dict]], None]] = {}
+
+    def _document(self, collection: str, doc_id: str) -> _Document:
+        documents = self.collections.setdefault(collection, {})
+        document = documents.get(doc_id)
+        if document is None:
+            document = documents[doc_id] = _Document()
+        return document
+
+    def get(
+        self, collection: str, doc_id: str, version: Optional[int] = None
+    ) -> Tuple[int, Optional[Dict[str, Any]]]:
+        document = self.collections.get(collection, {}).get(doc_id)
+        if document is None:
+            return 0, None
+        if version is None:
+            return document.latest()
+        return document.at(version)
+
+    def list_ids(self, collection: str) -> List[str]:
+        return [
+            doc_id
+            for doc_id, document in self.collections.get(
+                collection, {}
+            ).items()
+            if document.latest()[1] is not None
+        ]
+
+    def begin(self) -> int:
+        self._active[self.version] = self._active.get(self.version, 0) + 1
+        return self.version
+
+    def end(self, snapshot: int) -> None:
+        self._active[snapshot] -= 1
+        if not self._active[snapshot]:
+            del self._active[snapshot]
+
+    def commit(
+        self,
+        writes: List[Write],
+        reads: Optional[Dict[Tuple[str, str], int]] = None,
+    ) -> int:
+        # Runs without awaiting so it is atomic on the event loop
+        for (collection, doc_id), version in (reads or {}).items():
+            if self.get(collection, doc_id)[0] != version:
+                raise TransactionConflict(
+                    f"Document {collection}/{doc_id} changed since read"
+                )
+        if not writes:
+            return self.version
+        self.version += 1
+        oldest = min(self._active) if self._active else self.version
+        written = []
+        for collection, doc_id, operation, payload in writes:
+            document = self._document(collection, doc_id)
+            current = document.latest()[1]
+            if operation == "set":
+                data = payload
+            elif operation == "update":
+                changes, fallback = payload
+                # Same as Firestore falling back to creating the document
+                data = (
+                    fallback
+                    if current is None
+                    else apply_changes(current, changes)
+                )
+            elif operation == "delete":
+                data = None
+            else:
+                raise ValueError(f"Unknown operation '{operation}'")
+            if document.versions and document.versions[-1][0] == self.version:
+                document.versions[-1] = (self.version, data)
+            else:
+                document.versions.append((self.version, data))
+            # Drop versions no running transaction can read any more
+            keep = 0
+            for i, (version, _) in enumerate(document.versions):
+                if version <= oldest:
+                    keep = i
+            del document.versions[:keep]
+            written.append((collection, doc_id, data))
+        for collection, doc_id, data in written:
+            listener = self.listeners.get(collection)
+            if listener is not None:
+                listener(doc_id, data)
+        return self.version
+
+    def dump(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {
+            collection: {
+                doc_id: document.latest()[1]
+                for doc_id, document in documents.items()
+                if document.latest()[1] is not None
+            }
+            for collection, documents in self.collections.items()
+        }
+
+    def load(self, data: Dict[str, Dict[str, Dict[str, Any]]]) -> None:
+        self.commit(
+            [
+                (collection, doc_id, "set", document)
+                for collection, documents in data.items()
+                for doc_id, document in documents.items()
+            ]
+        )
+
+
+class MemoryTransaction:
+    def __init__(self, store: MemoryStore) -> None:
+        self.store = store
+        self.snapshot: Optional[int] = None
+        self.reads: Dict[Tuple[str, str], int] = {}
+        self.writes: List[Write] = []
+
+    def begin(self) -> None:
+        self.snapshot = self.store.begin()
+        self.reads = {}
+        self.writes = []
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        version, data = self.store.get(collection, doc_id, self.snapshot)
+        self.reads[(collection, doc_id)] = version
+        return data
+
+    def write(self, write: Write) -> None:
+        # Applied on commit, like Firestore
+        self.writes.append(write)
+
+    def commit(self) -> None:
+        try:
+            self.store.commit(self.writes, self.reads)
+        finally:
+            self.store.end(self.snapshot)
+
+    def rollback(self) -> None:
+        self.store.end(self.snapshot)
+
+
+def transactional(
+    func: Callable[..., Awaitable[Any]], max_attempts: int = 5
+) -> Callable[..., Awaitable[Any]]:
+    """
+    Counterpart of `google.cloud.firestore.async_transactional`: runs `func`
+    in the given transaction and retries it when committing conflicts with a
+    transaction that committed first.
+    """
+
+    @functools.wraps(func)
+    async def wrapped(
+        transaction: MemoryTransaction, *args: Any, **kwargs: Any
+    ) -> Any:
+        for attempt in range(max_attempts):
+            transaction.begin()
+            try:
+                result = await func(transaction, *args, **kwargs)
+            except BaseException:
+                transaction.rollback()
+                raise
+            try:
+                transaction.commit()
+            except TransactionConflict:
+                if attempt == max_attempts - 1:
+                    raise
+                continue
+            return result
+
+    return wrapped
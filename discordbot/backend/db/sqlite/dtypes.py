@@ -0,0 +1,166 @@
+import json
+import sqlite3
+from typing import Any, Dict, List
+
+from ..bases import BaseDataModel, CounterBase, QuizBase, UserBase
+from .pool import ConnectionPool, Operation, SQLiteTransaction
+
+INSERT_USER = (
+    "INSERT OR REPLACE INTO users (id, name, censor_exempt) VALUES (?, ?, ?)"
+)
+UPDATE_USER = "UPDATE users SET name = ?, censor_exempt = ? WHERE id = ?"
+INSERT_MESSAGE = (
+    "INSERT OR IGNORE INTO messages "
+    "(user_id, id, target, timestamp, content, sentiment, attachments) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+DELETE_MESSAGE = "DELETE FROM messages WHERE user_id = ? AND id = ?"
+DELETE_MESSAGES = "DELETE FROM messages WHERE user_id = ?"
+INSERT_COUNTER = "INSERT OR IGNORE INTO counters (name, value) VALUES (?, ?)"
+INCREMENT_COUNTER = "UPDATE counters SET value = value + ? WHERE name = ?"
+UPDATE_COUNTER = "UPDATE counters SET value = ? WHERE name = ?"
+
+
+def message_row(user_id: str, message: Dict[str, Any]) -> List[Any]:
+    return [
+        user_id,
+        message["id"],
+        message.get("target", ""),
+        message["timestamp"],
+        message.get("content", ""),
+        message.get("sentiment", 0.0),
+        json.dumps(message.get("attachments", [])),
+    ]
+
+
+def message_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "target": row["target"],
+        "timestamp": row["timestamp"],
+        "content": row["content"],
+        "sentiment": row["sentiment"],
+        "attachments": json.loads(row["attachments"]),
+    }
+
+
+class CommitManager:
+    def __init__(self, data: BaseDataModel, pool: ConnectionPool) -> None:
+        self.data = data
+        self.pool = pool
+
+    async def write(
+        self, operations: List[Operation], transaction: SQLiteTransaction
+    ) -> None:
+        self.data._changes.clear()
+        if not operations:
+            return
+        if transaction is not None:
+            for operation in operations:
+                transaction.write(operation)
+        else:
+            await self.pool.write(operations)
+
+
+def statement(sql: str, *params: Any) -> Operation:
+    return lambda conn: conn.execute(sql, params)
+
+
+def statements(sql: str, params: List[List[Any]]) -> Operation:
+    return lambda conn: conn.executemany(sql, params)
+
+
+class User(UserBase):
+    __slots__ = ("cm",)
+
+    def __init__(
+        self, data_dict: Dict[str, Any], pool: ConnectionPool
+    ) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+        self.cm = CommitManager(self, pool)
+
+    async def commit(self, *, transaction: SQLiteTransaction = None) -> None:
+        operations = []
+        changes = self._collect_changes()
+        if any(name in changes for name in ("id", "name", "censor_exempt")):
+            operations.append(
+                statement(UPDATE_USER, self.name, self.censor_exempt, self.id)
+            )
+        messages = changes.get("messages")
+        if messages is not None and messages.replace:
+            operations.append(statement(DELETE_MESSAGES, self.id))
+            operations.append(
+                statements(
+                    INSERT_MESSAGE,
+                    [message_row(self.id, m) for m in self.messages],
+                )
+            )
+        elif messages is not None:
+            # Copy the rows now as the model may change before committing
+            operations.append(
+                statements(
+                    DELETE_MESSAGE,
+                    [[self.id, m["id"]] for m in messages.remove],
+                )
+            )
+            operations.append(
+                statements(
+                    INSERT_MESSAGE,
+                    [message_row(self.id, m) for m in messages.union],
+                )
+            )
+        await self.cm.write(operations, transaction)
+
+    async def create(self, *, transaction: SQLiteTransaction = None) -> None:
+        await self.cm.write(
+            [
+                statement(
+                    INSERT_USER, self.id, self.name, self.censor_exempt
+                ),
+                statement(DELETE_MESSAGES, self.id),
+                statements(
+                    INSERT_MESSAGE,
+                    [message_row(self.id, m) for m in self.messages],
+                ),
+            ],
+            transaction,
+        )
+
+
+class Quiz(QuizBase):
+    __slots__ = ()
+
+    def __init__(self, data_dict: Dict[str, Any]) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+
+
+class Counter(CounterBase):
+    __slots__ = ("cm",)
+
+    def __init__(
+        self, data_dict: Dict[str, Any], pool: ConnectionPool
+    ) -> None:
+        super().__init__()
+        data_dict = data_dict or {}
+        self._data.update(data_dict)
+        self.cm = CommitManager(self, pool)
+
+    async def commit(self, *, transaction: SQLiteTransaction = None) -> None:
+        operations = []
+        change = self._collect_changes().get("value")
+        if change is not None and change.replace:
+            operations.append(statement(UPDATE_COUNTER, self.value, self.name))
+        elif change is not None and change.increment:
+            operations.append(
+                statement(INCREMENT_COUNTER, change.increment, self.name)
+            )
+        await self.cm.write(operations, transaction)
+
+    async def create(self, *, transaction: SQLiteTransaction = None) -> None:
+        await self.cm.write(
+            [statement(INSERT_COUNTER, self.name, self.value)], transaction
+        )
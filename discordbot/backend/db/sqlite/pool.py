@@ -0,0 +1,206 @@
+import asyncio
+import functools
+import random
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+# Statement run against a connection from a worker thread
+Operation = Callable[[sqlite3.Connection], Any]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    # Transactions are managed explicitly (isolation_level=None). Connections
+    # move between worker threads but are only ever used by one at a time.
+    conn = sqlite3.connect(
+        path,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=256,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Fixed pool of SQLite connections in WAL mode, with a thread pool to run
+    blocking statements off the event loop. WAL lets readers carry on while a
+    writer commits. Transactions hold a connection for their whole lifetime,
+    so they get `size` connections of their own; statements run from inside
+    a transaction then never wait on a connection held by one.
+    """
+
+    def __init__(self, path: str, size: int = 4) -> None:
+        self.path = path
+        self.size = size
+        self.executor = ThreadPoolExecutor(max_workers=size * 2)
+        self.connections = [connect(path) for _ in range(size * 2)]
+        self._free: Optional[asyncio.Queue] = None
+        self._free_transactional: Optional[asyncio.Queue] = None
+
+    @property
+    def free(self) -> asyncio.Queue:
+        # Created lazily so it belongs to the running event loop
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for conn in self.connections[: self.size]:
+                self._free.put_nowait(conn)
+        return self._free
+
+    @property
+    def free_transactional(self) -> asyncio.Queue:
+        if self._free_transactional is None:
+            self._free_transactional = asyncio.Queue()
+            for conn in self.connections[self.size :]:
+                self._free_transactional.put_nowait(conn)
+        return self._free_transactional
+
+    async def acquire(
+        self, *, transactional: bool = False
+    ) -> sqlite3.Connection:
+        if transactional:
+            return await self.free_transactional.get()
+        return await self.free.get()
+
+    def release(
+        self, conn: sqlite3.Connection, *, transactional: bool = False
+    ) -> None:
+        if transactional:
+            self.free_transactional.put_nowait(conn)
+        else:
+            self.free.put_nowait(conn)
+
+    async def run(self, conn: sqlite3.Connection, operation: Operation) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, operation, conn
+        )
+
+    async def execute(self, operation: Operation) -> Any:
+        conn = await self.acquire()
+        try:
+            return await self.run(conn, operation)
+        finally:
+            self.release(conn)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List:
+        return await self.execute(lambda c: c.execute(sql, params).fetchall())
+
+    async def write(self, operations: List[Operation]) -> None:
+        await self.execute(functools.partial(run_atomically, operations))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        for conn in self.connections:
+            conn.close()
+
+
+def run_atomically(
+    operations: List[Operation], conn: sqlite3.Connection
+) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for operation in operations:
+            operation(conn)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class SQLiteTransaction:
+    """
+    Reads go to the database straight away from a consistent snapshot, while
+    writes are collected and applied when committing, like Firestore. If
+    another connection committed since the snapshot was taken the commit
+    fails as busy and the transaction is retried.
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+        self.conn: Optional[sqlite3.Connection] = None
+        self.writes: List[Operation] = []
+
+    async def begin(self) -> None:
+        conn = await self.pool.acquire(transactional=True)
+        try:
+            await self.pool.run(conn, lambda c: c.execute("BEGIN"))
+        except BaseException:
+            self.pool.release(conn, transactional=True)
+            raise
+        self.conn = conn
+        self.writes = []
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List:
+        return await self.pool.run(
+            self.conn, lambda c: c.execute(sql, params).fetchall()
+        )
+
+    def write(self, operation: Operation) -> None:
+        self.writes.append(operation)
+
+    async def commit(self) -> None:
+        def commit(conn: sqlite3.Connection) -> None:
+            for operation in self.writes:
+                operation(conn)
+            conn.execute("COMMIT")
+
+        try:
+            await self.pool.run(self.conn, commit)
+        except BaseException:
+            await self.rollback()
+            raise
+        self.pool.release(self.conn, transactional=True)
+        self.conn = None
+
+    async def rollback(self) -> None:
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        try:
+            await self.pool.run(
+                conn, lambda c: c.in_transaction and c.execute("ROLLBACK")
+            )
+        finally:
+            self.pool.release(conn, transactional=True)
+
+
+def is_busy(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def transactional(
+    func: Callable[..., Awaitable[Any]], max_attempts: int = 5
+) -> Callable[..., Awaitable[Any]]:
+    """
+    Counterpart of `google.cloud.firestore.async_transactional`: runs `func`
+    in the given transaction and retries it, after a short random delay, when
+    another connection wrote to the database first.
+    """
+
+    @functools.wraps(func)
+    async def wrapped(
+        transaction: SQLiteTransaction, *args: Any, **kwargs: Any
+    ) -> Any:
+        for attempt in range(max_attempts):
+            await transaction.begin()
+            try:
+                result = await func(transaction, *args, **kwargs)
+                await transaction.commit()
+            except sqlite3.OperationalError as e:
+                await transaction.rollback()
+                if not is_busy(e) or attempt == max_attempts - 1:
+                    raise
+                # Back off with jitter so contending transactions spread out
+                await asyncio.sleep(random.uniform(0, 0.01 * 2**attempt))
+                continue
+            except BaseException:
+                await transaction.rollback()
+                raise
+            return result
+
+    return wrapped
@@ -0,0 +1,215 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Callable, List, Optional
+
+from ..bases import BaseDB, CounterBase, QuizBase, UserBase
+from ..censor import CensorMatcher
+from .dtypes import Counter, Quiz, User, message_dict
+from .pool import ConnectionPool, SQLiteTransaction, connect, transactional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL DEFAULT '',
+    censor_exempt INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    user_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    target TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    content TEXT NOT NULL,
+    sentiment REAL NOT NULL,
+    attachments TEXT NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS messages_user_timestamp
+    ON messages (user_id, timestamp);
+CREATE TABLE IF NOT EXISTS quiz_subjects (
+    subject TEXT PRIMARY KEY,
+    collection TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quizzes (
+    collection TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, name)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS counters_name ON counters (name);
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messaging (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+INSERT OR IGNORE INTO config (key, data) VALUES ('censor', '{"data": []}');
+"""
+
+SELECT_USER = "SELECT id, name, censor_exempt FROM users WHERE id = ?"
+SELECT_MESSAGES = (
+    "SELECT * FROM messages WHERE user_id = ? ORDER BY timestamp"
+)
+SELECT_CONFIG = "SELECT data FROM config WHERE key = ?"
+SELECT_SUBJECTS = "SELECT subject FROM quiz_subjects"
+SELECT_QUIZ_NAMES = (
+    "SELECT q.name FROM quiz_subjects s "
+    "JOIN quizzes q ON q.collection = s.collection WHERE s.subject = ?"
+)
+SELECT_QUIZ = (
+    "SELECT q.data FROM quiz_subjects s "
+    "JOIN quizzes q ON q.collection = s.collection "
+    "WHERE s.subject = ? AND q.name = ?"
+)
+SELECT_COUNTER = "SELECT name, value FROM counters WHERE name = ?"
+SELECT_MESSAGING = "SELECT * FROM messaging ORDER BY id LIMIT 500"
+DELETE_MESSAGING = "DELETE FROM messaging WHERE id <= ?"
+
+
+class SQLiteDB(BaseDB):
+    """
+    Database on a local SQLite file in WAL mode for self-hosted deployments.
+    Blocking calls run on a small pool of connections and worker threads.
+    Messages inserted into the `messaging` table by other processes, and
+    changes to the censor list, are picked up by a polling thread.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, Any], None],
+        *,
+        path: str = "discordbot.sqlite3",
+        pool_size: int = 4,
+        messaging_interval: float = 0.5,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(callback, **kwargs)
+        self.transactional = transactional
+
+        self.callback = callback
+        self.pool = ConnectionPool(path, pool_size)
+        # First time setup
+        self.pool.connections[0].executescript(SCHEMA)
+
+        # Compiled censor list and the raw list it was compiled from, kept
+        # up to date by the polling thread so matching reads nothing
+        self.censor_matcher = CensorMatcher([])
+        self.censor_raw = ""
+        self.update_censor(self.pool.connections[0])
+
+        # Messaging service
+        self.messaging_interval = messaging_interval
+        self.messaging_stop = threading.Event()
+        self.messaging_thread = threading.Thread(
+            target=self.poll_messaging, args=(path,), daemon=True
+        )
+        self.messaging_thread.start()
+
+    def transaction(self) -> SQLiteTransaction:
+        return SQLiteTransaction(self.pool)
+
+    async def close(self) -> None:
+        await super().close()
+        self.messaging_stop.set()
+        self.messaging_thread.join()
+        self.pool.close()
+
+    def update_censor(self, conn: sqlite3.Connection) -> None:
+        raw = conn.execute(SELECT_CONFIG, ("censor",)).fetchone()["data"]
+        if raw != self.censor_raw:
+            # Built before being swapped in so readers never see it half
+            # built
+            self.censor_matcher = CensorMatcher(json.loads(raw)["data"])
+            self.censor_raw = raw
+
+    def poll_messaging(self, path: str) -> None:
+        conn = connect(path)
+        while not self.messaging_stop.wait(self.messaging_interval):
+            try:
+                self.update_censor(conn)
+            except Exception as e:
+                print(f"Polling censor list failed on {e}")
+            try:
+                rows = conn.execute(SELECT_MESSAGING).fetchall()
+                for row in rows:
+                    self.callback(
+                        "message",
+                        {"target": row["target"], "content": row["content"]},
+                    )
+                if rows:
+                    # The callbacks have been handed off, so we are done
+                    conn.execute(DELETE_MESSAGING, (rows[-1]["id"],))
+            except Exception as e:
+                print(f"Polling messages failed on {e}")
+        conn.close()
+
+    async def fetchall(
+        self,
+        sql: str,
+        params: List[Any],
+        transaction: Optional[SQLiteTransaction] = None,
+    ) -> List:
+        if transaction is not None:
+            return await transaction.fetchall(sql, params)
+        return await self.pool.fetchall(sql, params)
+
+    async def censor_list(self) -> List[str]:
+        return json.loads(self.censor_raw)["data"]
+
+    async def censor_match(self, content: str) -> Optional[str]:
+        return self.censor_matcher.find(content)
+
+    async def get_user(
+        self, user_id: int, *, transaction: SQLiteTransaction = None
+    ) -> UserBase:
+        rows = await self.fetchall(SELECT_USER, [str(user_id)], transaction)
+        if not rows:
+            user = User({}, self.pool)
+            user.id = str(user_id)
+            await user.create(transaction=transaction)
+            return user
+        messages = await self.fetchall(
+            SELECT_MESSAGES, [str(user_id)], transaction
+        )
+        return User(
+            {
+                "id": rows[0]["id"],
+                "name": rows[0]["name"],
+                "censor_exempt": bool(rows[0]["censor_exempt"]),
+                "messages": [message_dict(row) for row in messages],
+            },
+            self.pool,
+        )
+
+    async def quiz_subjects(self) -> List[str]:
+        rows = await self.pool.fetchall(SELECT_SUBJECTS)
+        return [row["subject"] for row in rows]
+
+    async def quiz_list(self, subject: str) -> List[str]:
+        rows = await self.pool.fetchall(SELECT_QUIZ_NAMES, [subject])
+        return [row["name"] for row in rows]
+
+    async def get_quiz(self, subject: str, name: str) -> QuizBase:
+        rows = await self.pool.fetchall(SELECT_QUIZ, [subject, name])
+        if not rows:
+            return QuizBase()
+        return Quiz(json.loads(rows[0]["data"]))
+
+    async def get_counter(
+        self, name: str, *, transaction: SQLiteTransaction = None
+    ) -> CounterBase:
+        rows = await self.fetchall(SELECT_COUNTER, [name], transaction)
+        if not rows:
+            # Create a new counter
+            counter = Counter({"name": name, "value": 0}, self.pool)
+            await counter.create(transaction=transaction)
+            return counter
+        return Counter(dict(rows[0]), self.pool)
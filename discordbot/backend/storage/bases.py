@@ -1,13 +1,34 @@
-from typing import Any, List, Union
+import hashlib
+import io
+import json
+import tempfile
+from typing import Any, AsyncIterable, Dict, List, Tuple, Union
+
+from cachetools import LRUCache
+
+# Content addressed blobs live under here, shared by every message
+BLOB_PREFIX = "blobs/"
+MANIFEST = "manifest.json"
+
+
+def blob_path(digest: str) -> str:
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}"
 
 
 class BaseStorage:
+    def __init__(self) -> None:
+        # Digests of blobs known to be stored already
+        self.known_blobs: LRUCache = LRUCache(maxsize=4096)
+
     async def ls(self, prefix: str) -> List[str]:
         pass
 
     async def read(self, path: str) -> bytes:
         pass
 
+    async def exists(self, path: str) -> bool:
+        pass
+
     async def upload(
         self,
         path: Union[str, List[str]],
@@ -19,3 +40,56 @@ class BaseStorage:
 
     def public_url(self, path: str) -> str:
         pass
+
+    async def put_blob(
+        self, chunks: AsyncIterable[bytes], *, max_memory: int = 1024 * 1024
+    ) -> Tuple[str, int]:
+        """
+        Stores a stream under the SHA-256 of its content, unless a blob with
+        that content is stored already. The stream is hashed as it comes in
+        and buffered in memory up to `max_memory` bytes, then on disk.
+        Returns the digest and size.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fp: Any = io.BytesIO()
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                if size > max_memory and isinstance(fp, io.BytesIO):
+                    spilled = tempfile.TemporaryFile()
+                    spilled.write(fp.getvalue())
+                    fp.close()
+                    fp = spilled
+                fp.write(chunk)
+            hexdigest = digest.hexdigest()
+            path = blob_path(hexdigest)
+            known = hexdigest in self.known_blobs
+            if not known and not await self.exists(path):
+                fp.seek(0)
+                await self.upload(path, fp)
+            self.known_blobs[hexdigest] = True
+        finally:
+            fp.close()
+        return hexdigest, size
+
+    async def expand_manifests(
+        self, paths: List[str]
+    ) -> List[Tuple[str, str]]:
+        """
+        Pairs of (name, storage path) for the given paths, where manifests
+        are replaced by the files they list, named as if stored directly.
+        """
+        files = []
+        for path in paths:
+            if not path.endswith(f"/{MANIFEST}"):
+                files.append((path, path))
+                continue
+            prefix = path[: -len(MANIFEST)]
+            manifest: List[Dict[str, Any]] = json.loads(await self.read(path))
+            for entry in manifest:
+                files.append(
+                    (f"{prefix}{entry['name']}", blob_path(entry["blob"]))
+                )
+        return files
@@ -2,6 +2,7 @@ import asyncio
 import os
 from typing import Any, List, Union
 
+from aiohttp import ClientResponseError
 from gcloud.aio.storage import Storage
 
 from ..bases import BaseStorage
@@ -9,6 +10,7 @@ from ..bases import BaseStorage
 
 class GCSBucket(BaseStorage):
     def __init__(self) -> None:
+        super().__init__()
         self.client = Storage(
             service_file=os.environ.get("GOOGLE_APPLICATION_CREDENTIALS")
         )
@@ -31,6 +33,15 @@ class GCSBucket(BaseStorage):
     async def read(self, path: str) -> bytes:
         return await self.client.download(self.bucket_name, path)
 
+    async def exists(self, path: str) -> bool:
+        try:
+            await self.client.download_metadata(self.bucket_name, path)
+        except ClientResponseError as e:
+            if e.status == 404:
+                return False
+            raise
+        return True
+
     async def upload(
         self,
         path: Union[str, List[str]],
@@ -1,14 +1,14 @@
 import asyncio
 import traceback
-from typing import Any, Dict, List, Tuple, Type
+from typing import Any, Dict, Optional, Type
 
 import discord
-import discord.ext.tasks
 
 from ..backend.db import BaseDB
 from ..backend.services import BaseService
 from ..backend.storage import BaseStorage
 from . import chatwheel, lolapi, manager, proxy, quiz, counter
+from .callbacks import CallbackDispatcher
 from .routing import Pattern, RoutingList
 
 DEFAULT_ROUTING = RoutingList(
@@ -30,21 +30,72 @@ class BotClient(discord.Client):
         db_type: Type[BaseDB] = BaseDB,
         service_type: Type[BaseService] = BaseService,
         storage_type: Type[BaseStorage] = BaseStorage,
+        *,
+        db_options: Optional[Dict[str, Any]] = None,
+        db_callback_workers: int = 4,
+        soundboard_mix: bool = False,
+        upload_spool_dir: str = ".upload_spool",
+        dedupe_attachments: bool = False,
+        log_pipeline_timings: bool = False,
     ) -> None:
         super().__init__(intents=discord.Intents.all())
         self.db_type = db_type
+        self.db_options = db_options or {}
         self.service_type = service_type
         self.storage_type = storage_type
-        self.db_callback_buffer: List[Tuple[str, Dict[str, Any]]] = []
+        self.ready = False
+        # Set along with `ready`, created once there is a running loop
+        self.ready_event: Optional[asyncio.Event] = None
+        self.preloading: Optional[asyncio.Task] = None
+        self.db_callbacks = CallbackDispatcher(
+            self.db_callback_async, workers=db_callback_workers
+        )
+        self.quiz_sessions = quiz.QuizSessionManager()
+        self.game_watcher = lolapi.GameWatcher(self.send_to_channel)
+        self.manage_latency = manager.StageLatency()
+        # Print the time each message spent in each stage of `manage`
+        self.log_pipeline_timings = log_pipeline_timings
+        self.upload_spool_dir = upload_spool_dir
+        self.dedupe_attachments = dedupe_attachments
+        self.voice_sessions = chatwheel.VoiceSessions(
+            chatwheel.SOUNDBOARD, mix=soundboard_mix
+        )
+
+    async def setup_hook(self) -> None:
+        self.ready_event = asyncio.Event()
 
     async def on_ready(self) -> None:
         print(f"Logged on as {self.user}\n{'=' * 79}")
-        self.db = self.db_type(self.db_callback)
+        if self.ready:
+            # Fired again after reconnecting, when everything is already
+            # running
+            return
+        # Start consuming before the database can make any callbacks
+        self.db_callbacks.start(asyncio.get_running_loop())
+        self.db = self.db_type(self.db_callback, **self.db_options)
         self.service = self.service_type()
         self.storage = self.storage_type()
-        self.ready = False
-        self.run_db_callbacks.start()
+        self.uploads = manager.UploadStage(
+            self.storage,
+            self.manage_latency,
+            spool_dir=self.upload_spool_dir,
+            dedupe=self.dedupe_attachments,
+        )
+        self.uploads.start()
+        if lolapi.API is not None:
+            # Spawn the chart rendering workers before they are needed
+            lolapi.RENDERER.start()
+        # Transcode the soundboard in the background, kept so the task is not
+        # garbage collected before it is done
+        self.preloading = asyncio.ensure_future(chatwheel.SOUNDBOARD.preload())
+        self.preloading.add_done_callback(self.preloaded)
         self.ready = True
+        self.ready_event.set()
+
+    @staticmethod
+    def preloaded(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Preloading the soundboard failed on {task.exception()}")
 
     async def on_message(self, message: discord.Message) -> None:
         if not self.ready:
@@ -85,25 +136,52 @@ class BotClient(discord.Client):
                 "Oops, something broke! Please try again."
             )
 
-    @discord.ext.tasks.loop(seconds=0.5)
-    async def run_db_callbacks(self) -> None:
-        if not self.ready:
-            return
-        if self.db_callback_buffer:
-            try:
-                await self.db_callback_async(*self.db_callback_buffer.pop())
-            except Exception as e:
-                print(f"DB Callback failed on {e}")
+    async def on_raw_reaction_add(
+        self, payload: discord.RawReactionActionEvent
+    ) -> None:
+        if payload.user_id != self.user.id:
+            self.quiz_sessions.on_reaction_add(payload)
+
+    async def on_raw_reaction_remove(
+        self, payload: discord.RawReactionActionEvent
+    ) -> None:
+        if payload.user_id != self.user.id:
+            self.quiz_sessions.on_reaction_remove(payload)
+
+    async def on_raw_reaction_clear(
+        self, payload: discord.RawReactionClearEvent
+    ) -> None:
+        self.quiz_sessions.on_reaction_clear(payload)
+
+    async def close(self) -> None:
+        if hasattr(self, "uploads"):
+            await self.uploads.close()
+        # Flush anything the database is still holding on to
+        if hasattr(self, "db"):
+            await self.db.close()
+        await self.db_callbacks.close()
+        if self.preloading is not None:
+            self.preloading.cancel()
+        await lolapi.RENDERER.close()
+        self.game_watcher.close()
+        if lolapi.API is not None:
+            await lolapi.API.close()
+        await super().close()
+
+    async def send_to_channel(self, channel_id: int, content: str) -> None:
+        channel = self.get_channel(channel_id)
+        if channel is None:
+            channel = await self.fetch_channel(channel_id)
+        await channel.send(content)
 
     def db_callback(self, event: str, data: Dict[str, Any]) -> None:
         # Important note: this method can be called from other threads!
-        self.db_callback_buffer.append((event, data))
+        self.db_callbacks.submit(event, data)
 
     async def db_callback_async(
         self, event: str, data: Dict[str, Any]
     ) -> None:
-        while not self.ready:
-            await asyncio.sleep(0.1)
+        await self.ready_event.wait()
         print(f"DB Callback: {event}")
         print(f"Data: {data}")
         # This is just a PoC for now
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class CallbackDispatcher:
+    """
+    Bridges callbacks made from other threads (e.g. Firestore snapshot
+    listeners) onto the event loop. Callbacks are partitioned over a number of
+    worker queues by their target so callbacks for the same target run in the
+    order they were made while the rest run concurrently. Callbacks made
+    before starting are held on to and queued once started.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, Dict[str, Any]], Awaitable[None]],
+        *,
+        workers: int = 4,
+    ) -> None:
+        self.handler = handler
+        self.n_workers = max(1, workers)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queues: List[asyncio.Queue] = []
+        self.workers: List[asyncio.Task] = []
+        # Callbacks submitted before there was a loop to put them on
+        self.early: List[Tuple[str, Dict[str, Any], float]] = []
+        self.lock = threading.Lock()
+        # Backpressure metrics
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self.workers:
+            return
+        self.queues = [asyncio.Queue() for _ in range(self.n_workers)]
+        self.workers = [
+            loop.create_task(self.work(queue)) for queue in self.queues
+        ]
+        with self.lock:
+            self.loop = loop
+            early, self.early = self.early, []
+        # Anything submitted from now on is put after these
+        for item in early:
+            self.put(item)
+
+    def submit(self, event: str, data: Dict[str, Any]) -> None:
+        # Important note: this method can be called from other threads!
+        item = (event, data, time.monotonic())
+        with self.lock:
+            if self.loop is None:
+                self.early.append(item)
+                return
+        self.loop.call_soon_threadsafe(self.put, item)
+
+    def put(self, item: Tuple[str, Dict[str, Any], float]) -> None:
+        event, data, _ = item
+        key = data.get("target", event) if isinstance(data, dict) else event
+        self.queues[hash(key) % self.n_workers].put_nowait(item)
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "mean_wait": self.total_wait / max(1, self.processed),
+            "max_wait": self.max_wait,
+        }
+
+    async def work(self, queue: asyncio.Queue) -> None:
+        while True:
+            event, data, submitted = await queue.get()
+            wait = time.monotonic() - submitted
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            try:
+                await self.handler(event, data)
+            except Exception as e:
+                self.failed += 1
+                print(f"DB Callback failed on {e}")
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+    async def close(self, timeout: float = 5.0) -> None:
+        # Give queued callbacks a chance to finish before stopping
+        if self.queues:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(queue.join() for queue in self.queues)),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                print(f"Dropping {self.depth} DB callbacks on close")
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
@@ -1,5 +1,7 @@
 from ..routing import Pattern, RoutingList
 from . import endpoints
+from .sessions import GuildAudio, QueueFull, VoiceSessions
+from .soundboard import SOUNDBOARD, OpusPacketSource, Soundboard, load_registry
 
 PATTERNS = RoutingList(
     [
@@ -1,9 +1,9 @@
-import os
 from typing import TYPE_CHECKING, Optional, Sequence
 
 import discord
 
 from ..routing import Endpoint
+from .sessions import QueueFull
 
 if TYPE_CHECKING:
     from .. import BotClient
@@ -12,9 +12,8 @@ if TYPE_CHECKING:
 def get_voice_client_by_guild(
     self: "BotClient", guild: discord.Guild
 ) -> Optional[discord.VoiceClient]:
-    for voice_client in self.voice_clients:
-        if voice_client.guild == guild:
-            return voice_client
+    # Looked up by guild id by discord.py
+    return guild.voice_client
 
 
 @Endpoint()
@@ -40,6 +39,7 @@ async def leave_user(
 ) -> None:
     voice_client = get_voice_client_by_guild(self, message.guild)
     if voice_client is not None:
+        self.voice_sessions.end(message.guild)
         await voice_client.disconnect()
 
 
@@ -61,24 +61,13 @@ async def play_audio(
         else:
             return  # Nothing we can do
 
-    fnames = {
-        "next-level-play": "Misc_soundboard_next_level.mp3.mpeg",
-        "ni-qi-bu-qi": "Misc_soundboard_ni_qi_bu_qi.mp3.mpeg",
-        "disaster": "Misc_soundboard_disastah.mp3.mpeg",
-        "lakad-matataaag": "Misc_soundboard_ta_daaaa.mp3.mpeg",
-        "easy-money": "Misc_soundboard_easiest_money.mp3.mpeg",
-        "dui-you-ne": "Misc_soundboard_duiyou_ne.mp3.mpeg",
-        "absolutely-perfect": "Misc_soundboard_absolutely_perfect.mp3.mpeg",
-        "piao-liang": "Misc_soundboard_piao_liang.mp3.mpeg",
-        "ceeeb": "Misc_soundboard_ceeeb_start.mp3.mpeg",
-        "cooking-boom": "Misc_soundboard_whats_cooking.mp3.mpeg",
-        "no-chill": "Misc_soundboard_no_chill.mp3.mpeg",
-        "gan-ma-ne-xiong-di": "Misc_soundboard_gan_ma_ne_xiong_di.mp3.mpeg",
-        "xqc-wa-ching": "XQC_Lux_waching.mp3",
-        "xqc-aaa-pow": "XQC_Lux_aaapow.mp3",
-        "what-a-save": "What_A_Save.mp3",
-    }
-    fname = os.path.join(
-        os.path.dirname(__file__), "audio", fnames.get(groups[0])
-    )
-    voice_client.play(discord.FFmpegOpusAudio(fname))
+    # Queued or mixed in if something is already playing
+    try:
+        played = await self.voice_sessions.get(message.guild).play(groups[0])
+    except QueueFull:
+        await message.channel.send(
+            "Too many sound clips are queued, try again later"
+        )
+        return
+    if not played:
+        await message.channel.send(f"There is no sound clip {groups[0]}")
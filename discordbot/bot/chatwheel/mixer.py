@@ -0,0 +1,60 @@
+import threading
+from typing import List
+
+import discord
+import numpy as np
+
+# One 20 ms frame of 48 kHz stereo audio, in 16 bit samples
+FRAME_SAMPLES = discord.opus.Encoder.SAMPLES_PER_FRAME * 2
+
+
+class _Voice:
+    __slots__ = ("samples", "position")
+
+    def __init__(self, samples: np.ndarray) -> None:
+        self.samples = samples
+        self.position = 0
+
+
+class MixerSource(discord.AudioSource):
+    """
+    Overlays any number of clips into a single PCM stream. Clips can be added
+    while it plays; it runs dry (ending playback) once every clip is done.
+    Reads happen on the voice player thread, hence the lock.
+    """
+
+    def __init__(self) -> None:
+        self.voices: List[_Voice] = []
+        self.lock = threading.Lock()
+        self.frame = np.zeros(FRAME_SAMPLES, dtype=np.int32)
+
+    def add(self, pcm: bytes) -> None:
+        with self.lock:
+            self.voices.append(_Voice(np.frombuffer(pcm, dtype=np.int16)))
+
+    def is_active(self) -> bool:
+        with self.lock:
+            return bool(self.voices)
+
+    def read(self) -> bytes:
+        with self.lock:
+            if not self.voices:
+                return b""
+            frame = self.frame
+            frame.fill(0)
+            for voice in self.voices:
+                chunk = voice.samples[
+                    voice.position : voice.position + FRAME_SAMPLES
+                ]
+                frame[: len(chunk)] += chunk
+                voice.position += FRAME_SAMPLES
+            self.voices = [
+                voice
+                for voice in self.voices
+                if voice.position < len(voice.samples)
+            ]
+        # Summed in 32 bits, then clipped so loud overlaps don't wrap around
+        return np.clip(frame, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return False
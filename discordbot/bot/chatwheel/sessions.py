@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import discord
+
+from .soundboard import Soundboard
+
+
+class QueueFull(Exception):
+    pass
+
+
+class GuildAudio:
+    """
+    Playback for one guild. Clips requested while another one is playing are
+    either queued to play next (up to `max_queue`, beyond which `QueueFull`
+    is raised), or with mixing on, overlaid on whatever is already playing.
+    """
+
+    def __init__(
+        self,
+        guild: discord.Guild,
+        soundboard: Soundboard,
+        *,
+        mix: bool = False,
+        max_queue: int = 8,
+    ) -> None:
+        self.guild = guild
+        self.soundboard = soundboard
+        self.mix = mix
+        self.queue: Deque[str] = deque(maxlen=max_queue)
+        self.mixer = None
+        self.lock = asyncio.Lock()
+        self.loop = asyncio.get_running_loop()
+
+    @property
+    def voice_client(self) -> Optional[discord.VoiceClient]:
+        return self.guild.voice_client
+
+    async def play(self, name: str) -> bool:
+        # False if there is no such clip
+        if name not in self.soundboard.clips:
+            return False
+        if self.mix:
+            pcm = await self.soundboard.get_pcm(name)
+            if self.mixer is None:
+                # Mixing is optional, so NumPy is only imported if used
+                from .mixer import MixerSource
+
+                self.mixer = MixerSource()
+            self.mixer.add(pcm)
+        elif len(self.queue) < self.queue.maxlen:
+            self.queue.append(name)
+        else:
+            raise QueueFull(name)
+        await self.play_next()
+        return True
+
+    async def play_next(self) -> None:
+        # Serialised so two clips never try to start at once
+        async with self.lock:
+            voice_client = self.voice_client
+            if voice_client is None or voice_client.is_playing():
+                return
+            if self.mix:
+                if self.mixer is not None and self.mixer.is_active():
+                    voice_client.play(self.mixer, after=self.after)
+                return
+            if self.queue:
+                source = await self.soundboard.source(self.queue.popleft())
+                if voice_client.is_connected():
+                    voice_client.play(source, after=self.after)
+
+    def after(self, error: Optional[Exception]) -> None:
+        # Called on the voice player thread when a source finishes
+        if error is not None:
+            print(f"Playing audio failed on {error}")
+        asyncio.run_coroutine_threadsafe(self.play_next(), self.loop)
+
+    def stop(self) -> None:
+        self.queue.clear()
+        self.mixer = None
+
+
+class VoiceSessions:
+    """
+    Audio sessions by guild id, created on first use.
+    """
+
+    def __init__(self, soundboard: Soundboard, *, mix: bool = False) -> None:
+        self.soundboard = soundboard
+        self.mix = mix
+        self.sessions: Dict[int, GuildAudio] = {}
+
+    def get(self, guild: discord.Guild) -> GuildAudio:
+        session = self.sessions.get(guild.id)
+        if session is None:
+            session = self.sessions[guild.id] = GuildAudio(
+                guild, self.soundboard, mix=self.mix
+            )
+        return session
+
+    def end(self, guild: discord.Guild) -> None:
+        session = self.sessions.pop(guild.id, None)
+        if session is not None:
+            session.stop()
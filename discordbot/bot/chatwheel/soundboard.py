@@ -0,0 +1,219 @@
+import asyncio
+import functools
+import os
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+AUDIO_DIR = os.path.join(os.path.dirname(__file__), "audio")
+
+# Names of the clips that have been around since before the registry was
+# loaded from the audio directory. Other clips are named after their file.
+ALIASES = {
+    "next-level-play": "Misc_soundboard_next_level.mp3.mpeg",
+    "ni-qi-bu-qi": "Misc_soundboard_ni_qi_bu_qi.mp3.mpeg",
+    "disaster": "Misc_soundboard_disastah.mp3.mpeg",
+    "lakad-matataaag": "Misc_soundboard_ta_daaaa.mp3.mpeg",
+    "easy-money": "Misc_soundboard_easiest_money.mp3.mpeg",
+    "dui-you-ne": "Misc_soundboard_duiyou_ne.mp3.mpeg",
+    "absolutely-perfect": "Misc_soundboard_absolutely_perfect.mp3.mpeg",
+    "piao-liang": "Misc_soundboard_piao_liang.mp3.mpeg",
+    "ceeeb": "Misc_soundboard_ceeeb_start.mp3.mpeg",
+    "cooking-boom": "Misc_soundboard_whats_cooking.mp3.mpeg",
+    "no-chill": "Misc_soundboard_no_chill.mp3.mpeg",
+    "gan-ma-ne-xiong-di": "Misc_soundboard_gan_ma_ne_xiong_di.mp3.mpeg",
+    "xqc-wa-ching": "XQC_Lux_waching.mp3",
+    "xqc-aaa-pow": "XQC_Lux_aaapow.mp3",
+    "what-a-save": "What_A_Save.mp3",
+}
+
+
+def clip_name(fname: str) -> str:
+    # e.g. Misc_soundboard_ceeeb_stop.mp3.mpeg -> ceeeb-stop
+    name = fname.split(".", 1)[0]
+    if name.startswith("Misc_soundboard_"):
+        name = name[len("Misc_soundboard_") :]
+    return name.lower().replace("_", "-")
+
+
+def load_registry(
+    audio_dir: str = AUDIO_DIR, aliases: Dict[str, str] = ALIASES
+) -> Dict[str, str]:
+    # Clip names to file names, for every clip in the audio directory
+    fnames = sorted(os.listdir(audio_dir))
+    registry = {k: v for k, v in aliases.items() if v in fnames}
+    aliased = set(registry.values())
+    for fname in fnames:
+        if fname not in aliased:
+            registry.setdefault(clip_name(fname), fname)
+    return registry
+
+
+# Packets are stored on disk with a little endian 16 bit length prefix
+_LENGTH = struct.Struct("<H")
+
+
+class OpusPacketSource(discord.AudioSource):
+    """
+    Plays Opus packets that were encoded ahead of time. Every read hands out
+    the next 20 ms packet, so playing needs no ffmpeg process and no
+    encoding.
+    """
+
+    def __init__(self, packets: List[bytes]) -> None:
+        self.packets = packets
+        self.position = 0
+
+    def read(self) -> bytes:
+        if self.position >= len(self.packets):
+            return b""
+        packet = self.packets[self.position]
+        self.position += 1
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+
+def transcode(path: str) -> List[bytes]:
+    # Runs ffmpeg once and keeps every packet it produces
+    source = discord.FFmpegOpusAudio(path)
+    try:
+        return list(iter(source.read, b""))
+    finally:
+        source.cleanup()
+
+
+def load_packets(path: str) -> List[bytes]:
+    with open(path, "rb") as fp:
+        data = fp.read()
+    packets = []
+    offset = 0
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        packets.append(data[offset : offset + length])
+        offset += length
+    return packets
+
+
+def save_packets(path: str, packets: List[bytes]) -> None:
+    # Write to a temporary file first so a crash never leaves half a file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fp:
+        for packet in packets:
+            fp.write(_LENGTH.pack(len(packet)))
+            fp.write(packet)
+    os.replace(tmp_path, path)
+
+
+class Soundboard:
+    """
+    Clips transcoded to Opus once and kept in memory. With a `cache_dir` the
+    packets are also written to disk, keyed on the source file's size and
+    modification time, so restarts skip transcoding too. Clips are loaded on
+    first play, or all at once with `preload`.
+    """
+
+    def __init__(
+        self,
+        clips: Dict[str, str],
+        audio_dir: str = AUDIO_DIR,
+        cache_dir: Optional[str] = None,
+    ) -> None:
+        self.clips = clips
+        self.audio_dir = audio_dir
+        self.cache_dir = cache_dir
+        self.packets: Dict[str, List[bytes]] = {}
+        self.pcm: Dict[str, bytes] = {}
+        # Loads in flight by cache and clip name
+        self.loading: Dict[Tuple[int, str], asyncio.Future] = {}
+
+    def cache_path(self, name: str) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        stat = os.stat(os.path.join(self.audio_dir, self.clips[name]))
+        return os.path.join(
+            self.cache_dir, f"{name}-{stat.st_size}-{stat.st_mtime_ns}.opus"
+        )
+
+    def load(self, name: str) -> List[bytes]:
+        cache_path = self.cache_path(name)
+        if cache_path is not None and os.path.exists(cache_path):
+            return load_packets(cache_path)
+        packets = transcode(os.path.join(self.audio_dir, self.clips[name]))
+        if cache_path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            save_packets(cache_path, packets)
+        return packets
+
+    def decode(self, packets: List[bytes]) -> bytes:
+        # 48 kHz stereo signed 16 bit PCM, as discord expects
+        decoder = discord.opus.Decoder()
+        return b"".join(decoder.decode(packet) for packet in packets)
+
+    async def load_once(
+        self,
+        cache: Dict[str, Any],
+        name: str,
+        load: Callable[..., Any],
+        *args: Any,
+    ) -> Any:
+        # Loads run on a thread, and everyone who asks for the same thing
+        # while it loads shares the result
+        value = cache.get(name)
+        if value is not None:
+            return value
+        key = (id(cache), name)
+        loading = self.loading.get(key)
+        if loading is None:
+            loading = asyncio.get_running_loop().run_in_executor(
+                None, load, *args
+            )
+            self.loading[key] = loading
+            loading.add_done_callback(
+                functools.partial(self.loaded, cache, name, key)
+            )
+        return await asyncio.shield(loading)
+
+    def loaded(
+        self,
+        cache: Dict[str, Any],
+        name: str,
+        key: Tuple[int, str],
+        loading: asyncio.Future,
+    ) -> None:
+        del self.loading[key]
+        if not loading.cancelled() and loading.exception() is None:
+            cache[name] = loading.result()
+
+    async def get(self, name: str) -> Optional[List[bytes]]:
+        if name not in self.clips:
+            return None
+        return await self.load_once(self.packets, name, self.load, name)
+
+    async def get_pcm(self, name: str) -> Optional[bytes]:
+        # Only needed for mixing, so decoded on first use
+        packets = await self.get(name)
+        if packets is None:
+            return None
+        return await self.load_once(self.pcm, name, self.decode, packets)
+
+    async def source(self, name: str) -> Optional[OpusPacketSource]:
+        packets = await self.get(name)
+        if packets is None:
+            return None
+        return OpusPacketSource(packets)
+
+    async def preload(self) -> None:
+        for name in self.clips:
+            try:
+                await self.get(name)
+            except Exception as e:
+                print(f"Loading sound {name} failed on {e}")
+
+
+SOUNDBOARD = Soundboard(
+    load_registry(), cache_dir=os.environ.get("soundboard_cache_dir") or None
+)
@@ -4,8 +4,12 @@ from . import endpoints
 PATTERNS = RoutingList(
     [
         Pattern(
-            r"^\.counter (.+) (\+|\-)$",
-            endpoints.edit_counter,
+            r"^\.counter (.+) \+$",
+            endpoints.increment_counter,
+        ),
+        Pattern(
+            r"^\.counter (.+) \-$",
+            endpoints.decrement_counter,
         ),
     ]
 )
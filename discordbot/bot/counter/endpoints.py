@@ -8,25 +8,37 @@ if TYPE_CHECKING:
     from .. import BotClient
 
 
+@Endpoint()
+async def increment_counter(
+    self: "BotClient",
+    message: discord.Message,
+    groups: Sequence[str],
+) -> None:
+    # Increments are written blindly to a shard, so they don't need a
+    # transaction and don't contend with each other
+    name = groups[0]
+    counter = await self.db.get_counter(name)
+    counter.increment("value", 1)
+    await counter.commit()
+    await message.channel.send(
+        f'Counter "{counter.name}" is now at {counter.value}.'
+    )
+
+
 @Endpoint(require_transaction=True)
-async def edit_counter(
+async def decrement_counter(
     self: "BotClient",
     message: discord.Message,
     groups: Sequence[str],
     transaction: Any,
 ) -> None:
-    name, mode = groups
+    name = groups[0]
     counter = await self.db.get_counter(name, transaction=transaction)
-    if mode == "+":
-        counter.value += 1
-    elif mode == "-":
-        if counter.value > 0:
-            counter.value -= 1
-        else:
-            await message.channel.send(
-                "Counter is already 0, cannot decrement."
-            )
-            return
+    if counter.value > 0:
+        counter.increment("value", -1)
+    else:
+        await message.channel.send("Counter is already 0, cannot decrement.")
+        return
     await counter.commit(transaction=transaction)
     await message.channel.send(
         f'Counter "{counter.name}" is now at {counter.value}.'
@@ -1,5 +1,9 @@
 from ..routing import Pattern, RoutingList
 from . import endpoints
+from .caches import RENDERS, RenderCache
+from .query import API
+from .render import RENDERER, ChartRenderer, RendererBusy
+from .watcher import GameWatcher
 
 PATTERNS = RoutingList(
     [
@@ -11,5 +15,17 @@ PATTERNS = RoutingList(
             r"^\.lol p(?:rofile)? ([a-zA-Z]{2,4}) (.{1,16})$",
             endpoints.lol_profile,
         ),
+        Pattern(
+            r"^\.lol g(?:ame)? ([a-zA-Z]{2,4}) (.{1,16})$",
+            endpoints.lol_game,
+        ),
+        Pattern(
+            r"^\.lol w(?:atch)? ([a-zA-Z]{2,4}) (.{1,16})$",
+            endpoints.lol_watch,
+        ),
+        Pattern(
+            r"^\.lol unwatch ([a-zA-Z]{2,4}) (.{1,16})$",
+            endpoints.lol_unwatch,
+        ),
     ]
 )
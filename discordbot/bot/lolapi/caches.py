@@ -0,0 +1,60 @@
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from cachetools import LRUCache
+
+
+class RenderCache:
+    """
+    Rendered mastery charts and profile embeds, keyed on the summoner's
+    revision and the game version. Riot bumps `revisionDate` whenever the
+    summoner changes, so an entry is valid for as long as its key is the
+    latest one and stale entries just age out. Charts are bounded by their
+    total size in bytes, embeds by their count.
+    """
+
+    def __init__(
+        self, image_bytes: int = 32 * 1024 * 1024, embeds: int = 1024
+    ) -> None:
+        self.images: LRUCache = LRUCache(maxsize=image_bytes, getsizeof=len)
+        self.embeds: LRUCache = LRUCache(maxsize=embeds)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(summoner: Any, game_version: str) -> Tuple[Hashable, ...]:
+        return (
+            summoner.region,
+            summoner.puuid,
+            summoner.revision_date,
+            game_version,
+        )
+
+    def _get(self, cache: LRUCache, key: Tuple[Hashable, ...]) -> Any:
+        value = cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_image(self, key: Tuple[Hashable, ...]) -> Optional[bytes]:
+        return self._get(self.images, key)
+
+    def put_image(self, key: Tuple[Hashable, ...], image: bytes) -> None:
+        if len(image) <= self.images.maxsize:
+            self.images[key] = image
+
+    def get_embed(
+        self, key: Tuple[Hashable, ...]
+    ) -> Optional[Dict[str, Any]]:
+        # Embed data as from `discord.Embed.to_dict`, to be rebuilt by the
+        # caller so nobody mutates the cached copy
+        return self._get(self.embeds, key)
+
+    def put_embed(
+        self, key: Tuple[Hashable, ...], embed: Dict[str, Any]
+    ) -> None:
+        self.embeds[key] = embed
+
+
+RENDERS = RenderCache()
@@ -4,7 +4,14 @@ from typing import TYPE_CHECKING, Sequence
 import discord
 
 from ..routing import Endpoint
-from .utils import generate_embed, generate_visual, requires_rg_api
+from .query import API
+from .utils import (
+    describe_game,
+    generate_embed,
+    generate_visual,
+    get_game_info,
+    requires_rg_api,
+)
 
 if TYPE_CHECKING:
     from .. import BotClient
@@ -22,9 +29,7 @@ async def lol_masteries(
         await message.channel.send(image_bytes)
         return
     await message.channel.send(
-        file=discord.File(
-            io.BytesIO(image_bytes.getvalue()), filename="masteries.png"
-        )
+        file=discord.File(io.BytesIO(image_bytes), filename="masteries.png")
     )
 
 
@@ -40,3 +45,71 @@ async def lol_profile(
         await message.channel.send(embed)
         return
     await message.channel.send(embed=embed)
+
+
+@Endpoint()
+@requires_rg_api
+async def lol_game(
+    self: "BotClient", message: discord.Message, groups: Sequence[str]
+) -> None:
+    region = groups[0]
+    user_name = groups[1]
+    success, info = await get_game_info(user_name, region)
+    if not success:
+        await message.channel.send(info)
+        return
+    summoner, game = info
+    if game is None:
+        await message.channel.send(f"{summoner.name} is not in a game")
+        return
+    await message.channel.send(
+        await describe_game(summoner.name, summoner.region, summoner.id, game)
+    )
+
+
+@Endpoint()
+@requires_rg_api
+async def lol_watch(
+    self: "BotClient", message: discord.Message, groups: Sequence[str]
+) -> None:
+    region = groups[0]
+    user_name = groups[1]
+    success, info = await get_game_info(user_name, region)
+    if not success:
+        await message.channel.send(info)
+        return
+    summoner, game = info
+    added = self.game_watcher.add(
+        summoner.region,
+        summoner.id,
+        summoner.name,
+        message.channel.id,
+        game["gameId"] if game is not None else None,
+    )
+    if not added:
+        await message.channel.send(f"Already watching {summoner.name}")
+        return
+    status = "in a game" if game is not None else "not in a game"
+    await message.channel.send(
+        f"Watching {summoner.name} (currently {status}). "
+        "I'll post here when they start or finish a game."
+    )
+
+
+@Endpoint()
+@requires_rg_api
+async def lol_unwatch(
+    self: "BotClient", message: discord.Message, groups: Sequence[str]
+) -> None:
+    region = groups[0]
+    user_name = groups[1]
+    summoner = await API.get_summoner_by_name(user_name, region)
+    if isinstance(summoner, str):
+        await message.channel.send(summoner)
+        return
+    if self.game_watcher.remove(
+        summoner.region, summoner.id, message.channel.id
+    ):
+        await message.channel.send(f"Stopped watching {summoner.name}")
+    else:
+        await message.channel.send(f"Not watching {summoner.name}")
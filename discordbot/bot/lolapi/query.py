@@ -1,11 +1,260 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
 import os
-from typing import Dict, List, Tuple, Union
+import time
+from collections import deque
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import httpx
+from cachetools import TTLCache
 from pantheon import pantheon
 from pantheon.utils.exceptions import NotFound
 
 
+# (requests, seconds) pairs, as in Riot's X-App-Rate-Limit header. These are
+# the limits of a development key.
+DEFAULT_APP_LIMITS = [(20, 1.0), (100, 120.0)]
+DEFAULT_METHOD_LIMITS = {
+    "getSummonerByName": [(1600, 60.0)],
+    "getChampionMasteries": [(20000, 10.0)],
+    "getCurrentGame": [(20000, 10.0)],
+}
+# Lower goes first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class TokenBucket:
+    """
+    Allows `capacity` requests in any span of `period` seconds. Each token
+    taken is returned to the bucket one period later, so unlike a bucket that
+    refills at a steady rate it can never let through more than Riot's fixed
+    windows allow.
+    """
+
+    def __init__(self, capacity: int, period: float) -> None:
+        self.capacity = capacity
+        self.period = period
+        # When the tokens that are out will be returned, oldest first
+        self.returns: Deque[float] = deque()
+
+    def delay(self, now: float) -> float:
+        # Seconds until a token is available
+        while self.returns and self.returns[0] <= now:
+            self.returns.popleft()
+        if len(self.returns) < self.capacity:
+            return 0.0
+        return self.returns[0] - now
+
+    def take(self, now: float) -> None:
+        self.returns.append(now + self.period)
+
+
+class _Request:
+    __slots__ = ("key", "call", "args", "future", "queued")
+
+    def __init__(
+        self,
+        key: Hashable,
+        call: Callable[..., Awaitable[Any]],
+        args: Tuple[Any, ...],
+        future: asyncio.Future,
+    ) -> None:
+        self.key = key
+        self.call = call
+        self.args = args
+        self.future = future
+        self.queued = time.monotonic()
+
+
+class _RegionQueue:
+    def __init__(
+        self,
+        app_limits: List[Tuple[int, float]],
+        method_limits: Dict[str, List[Tuple[int, float]]],
+    ) -> None:
+        self.app_buckets = [TokenBucket(*limit) for limit in app_limits]
+        self.method_limits = method_limits
+        self.method_buckets: Dict[str, List[TokenBucket]] = {}
+        # Heap of (priority, sequence, request) by method
+        self.queues: Dict[str, List[Tuple[int, int, _Request]]] = {}
+        self.wakeup = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+
+    def buckets(self, method: str) -> List[TokenBucket]:
+        buckets = self.method_buckets.get(method)
+        if buckets is None:
+            buckets = self.method_buckets[method] = [
+                TokenBucket(*limit)
+                for limit in self.method_limits.get(method, [])
+            ]
+        return buckets
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+
+class RiotScheduler:
+    """
+    Sends Riot API requests within the app and method rate limits of each
+    region. Requests wait in a priority queue per region and method, and
+    identical requests made while one is already queued or running share its
+    result instead of spending another request.
+    """
+
+    def __init__(
+        self,
+        app_limits: Optional[List[Tuple[int, float]]] = None,
+        method_limits: Optional[Dict[str, List[Tuple[int, float]]]] = None,
+    ) -> None:
+        self.app_limits = app_limits or DEFAULT_APP_LIMITS
+        self.method_limits = method_limits or DEFAULT_METHOD_LIMITS
+        self.regions: Dict[str, _RegionQueue] = {}
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        # Requests being sent, kept so they can be cancelled on close
+        self.sending: Set[asyncio.Task] = set()
+        self.sequence = itertools.count()
+        # Metrics
+        self.sent = 0
+        self.deduplicated = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def region(self, region: str) -> _RegionQueue:
+        queue = self.regions.get(region)
+        if queue is None:
+            queue = self.regions[region] = _RegionQueue(
+                self.app_limits, self.method_limits
+            )
+        return queue
+
+    async def submit(
+        self,
+        region: str,
+        method: str,
+        call: Callable[..., Awaitable[Any]],
+        *args: Any,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Any:
+        key = (region, method, args)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(future)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        queue = self.region(region)
+        request = _Request(key, call, args, future)
+        heapq.heappush(
+            queue.queues.setdefault(method, []),
+            (priority, next(self.sequence), request),
+        )
+        queue.wakeup.set()
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.ensure_future(self.work(queue))
+        return await asyncio.shield(future)
+
+    async def work(self, queue: _RegionQueue) -> None:
+        while queue.depth():
+            queue.wakeup.clear()
+            now = time.monotonic()
+            app_delay = max(b.delay(now) for b in queue.app_buckets)
+            # The most urgent request of the methods that have tokens left
+            best: Optional[Tuple[int, int, _Request]] = None
+            best_method = ""
+            method_delay = float("inf")
+            for method, heap in queue.queues.items():
+                if not heap:
+                    continue
+                delay = max(
+                    (b.delay(now) for b in queue.buckets(method)), default=0.0
+                )
+                method_delay = min(method_delay, delay)
+                if delay == 0.0 and (best is None or heap[0] < best):
+                    best, best_method = heap[0], method
+            if app_delay > 0.0 or best is None:
+                # Sleep until a token is back, or a new request comes in
+                try:
+                    await asyncio.wait_for(
+                        queue.wakeup.wait(), max(app_delay, method_delay)
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(queue.queues[best_method])
+            for bucket in queue.app_buckets + queue.buckets(best_method):
+                bucket.take(now)
+            request = best[2]
+            wait = now - request.queued
+            self.sent += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            sending = asyncio.ensure_future(self.send(request))
+            self.sending.add(sending)
+            sending.add_done_callback(self.sending.discard)
+
+    async def send(self, request: _Request) -> None:
+        try:
+            result = await request.call(*request.args)
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except Exception as e:
+            request.future.set_exception(e)
+            # Mark it as retrieved in case every caller has been cancelled
+            request.future.exception()
+        else:
+            request.future.set_result(result)
+        finally:
+            del self.in_flight[request.key]
+
+    async def close(self) -> None:
+        # Requests still queued or being sent are cancelled for their callers
+        tasks = [
+            queue.worker
+            for queue in self.regions.values()
+            if queue.worker is not None
+        ]
+        tasks.extend(self.sending)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in self.regions.values():
+            queue.queues.clear()
+        for future in self.in_flight.values():
+            future.cancel()
+        self.in_flight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": {
+                region: queue.depth()
+                for region, queue in self.regions.items()
+            },
+            "in_flight": len(self.in_flight),
+            "sent": self.sent,
+            "deduplicated": self.deduplicated,
+            "mean_wait": self.total_wait / self.sent if self.sent else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
 class Summoner:
     def __init__(self, data: Dict[str, str], region: str) -> None:
         self.data = data
@@ -35,12 +284,13 @@ class Summoner:
         )
 
     async def get_masteries(self) -> Tuple[List[str], List[int]]:
-        res = await API.get_panth(self.region).getChampionMasteries(self.id)
-        if any(info["championId"] not in API.champions for info in res):
-            await API.refresh_data(self.region)
+        res = await API.call(self.region, "getChampionMasteries", self.id)
+        await API.ensure_data(
+            self.region, [info["championId"] for info in res]
+        )
         # Actually comes sorted from lowest to highest
         cms = [
-            (API.champions[info["championId"]], info["championPoints"])
+            (API.champion_name(info["championId"]), info["championPoints"])
             for info in res
         ]
         names = [r[0] for r in cms[::-1]]
@@ -49,7 +299,18 @@ class Summoner:
 
 
 class LoLAPI:
-    def __init__(self, key: str, regions: Dict[str, str]) -> None:
+    def __init__(
+        self,
+        key: str,
+        regions: Dict[str, str],
+        *,
+        summoner_ttl: float = 60.0,
+        summoner_cache_size: int = 1024,
+        data_dir: str = ".ddragon",
+        lang: str = "en_AU",
+        version_ttl: float = 3600.0,
+        app_limits: Optional[List[Tuple[int, float]]] = None,
+    ) -> None:
         self.key = key
         self.regions = regions
         self.panths = {
@@ -58,38 +319,194 @@ class LoLAPI:
         self.game_version: str = ""
         self.champions: Dict[int, str] = {}
         self.champion_images: Dict[str, str] = {}
+        # Recently looked up summoners by region and normalised name
+        self.summoners: TTLCache = TTLCache(
+            maxsize=summoner_cache_size, ttl=summoner_ttl
+        )
+        # Data Dragon static data is kept on disk per game version
+        self.data_dir = data_dir
+        self.lang = lang
+        self.client: Optional[httpx.AsyncClient] = None
+        # Refreshes in flight by region, shared by everyone who asks
+        self.refreshes: Dict[str, asyncio.Future] = {}
+        # Loaded from disk on first use rather than blocking startup
+        self.loading: Optional[asyncio.Future] = None
+        # The live version is checked again after `version_ttl` seconds
+        self.version_ttl = version_ttl
+        self.version_checked = -math.inf
+        # Every Riot API request goes through here
+        self.scheduler = RiotScheduler(app_limits)
 
     def get_panth(self, region: str) -> pantheon.Pantheon:
         return self.panths[region.lower()]
 
-    async def refresh_data(self, region: str) -> None:
-        async with httpx.AsyncClient() as client:
-            region_info = await client.get(
-                f"https://ddragon.leagueoflegends.com/realms/{region}.json"
+    async def call(
+        self,
+        region: str,
+        method: str,
+        *args: Any,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Any:
+        # Raises KeyError straight away for an unknown region
+        call = getattr(self.get_panth(region), method)
+        return await self.scheduler.submit(
+            region.lower(), method, call, *args, priority=priority
+        )
+
+    def get_client(self) -> httpx.AsyncClient:
+        # Created lazily so it belongs to the running event loop, and kept
+        # around so connections are reused
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url="https://ddragon.leagueoflegends.com"
             )
-            region_info = region_info.json()
-            lang = "en_AU"  # region_info['l']
-            ver = region_info["n"]["champion"]
-            self.game_version = ver
-            champdata = await client.get(
-                f"https://ddragon.leagueoflegends.com/cdn/{ver}/data/{lang}/"
-                "championFull.json"
+        return self.client
+
+    async def close(self) -> None:
+        await self.scheduler.close()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def data_path(self, version: str) -> str:
+        return os.path.join(self.data_dir, version, f"{self.lang}.json")
+
+    def load_data(self, version: str) -> bool:
+        try:
+            with open(self.data_path(version)) as fp:
+                champdata = json.load(fp)
+        except (OSError, ValueError):
+            return False
+        # Runs on a thread, so the version changes only once the champions
+        # are in
+        for key, (name, image) in champdata.items():
+            self.champions[int(key)] = name
+            self.champion_images[name] = image
+        self.game_version = version
+        return True
+
+    def load_latest_data(self) -> None:
+        # Start off with whatever was downloaded last, if anything
+        try:
+            versions = os.listdir(self.data_dir)
+        except OSError:
+            return
+
+        def version_key(version: str) -> Tuple[int, ...]:
+            try:
+                return tuple(int(part) for part in version.split("."))
+            except ValueError:
+                return ()
+
+        for version in sorted(versions, key=version_key, reverse=True):
+            if self.load_data(version):
+                return
+
+    def champion_name(self, champion_id: int) -> str:
+        # Champions can still be missing if Data Dragon lags behind a patch
+        return self.champions.get(champion_id, f"Champion {champion_id}")
+
+    async def ensure_data(
+        self, region: str, champion_ids: Iterable[int] = ()
+    ) -> None:
+        """
+        Makes sure static data is loaded before it is used: from disk on
+        first use, then checking the live version every `version_ttl`
+        seconds, or at most once a minute while champions are missing. If
+        checking fails the data we have is kept.
+        """
+        if self.loading is None:
+            self.loading = asyncio.get_running_loop().run_in_executor(
+                None, self.load_latest_data
             )
-            champdata = champdata.json()["data"]
-        for info in champdata.values():
-            self.champions[int(info["key"])] = info["name"]
-            self.champion_images[info["name"]] = info["image"]["full"]
+        await asyncio.shield(self.loading)
+        age = time.monotonic() - self.version_checked
+        missing = any(c not in self.champions for c in champion_ids)
+        if age < self.version_ttl and not (missing and age >= 60.0):
+            return
+        try:
+            await self.refresh_data(region.lower())
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            print(f"Refreshing Data Dragon data failed on {e}")
+            # Try again in a minute
+            self.version_checked = time.monotonic() - self.version_ttl + 60.0
+
+    def save_data(self, version: str, champdata: Dict) -> None:
+        path = self.data_path(version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a crash never leaves half a file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(champdata, fp)
+        os.replace(tmp_path, path)
+
+    async def refresh_data(self, region: str) -> None:
+        # Single flight: concurrent callers wait on the same refresh
+        refresh = self.refreshes.get(region)
+        if refresh is None:
+            refresh = asyncio.ensure_future(self._refresh_data(region))
+            self.refreshes[region] = refresh
+            refresh.add_done_callback(
+                lambda _: self.refreshes.pop(region, None)
+            )
+        await asyncio.shield(refresh)
+
+    async def _refresh_data(self, region: str) -> None:
+        client = self.get_client()
+        # The realms file is tiny and says which version is live
+        region_info = await client.get(f"/realms/{region}.json")
+        region_info.raise_for_status()
+        ver = region_info.json()["n"]["champion"]
+        self.version_checked = time.monotonic()
+        if ver == self.game_version:
+            return
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.load_data, ver):
+            return
+        # champion.json has the ids, names and images at a fraction of the
+        # size of championFull.json
+        champdata = await client.get(
+            f"/cdn/{ver}/data/{self.lang}/champion.json"
+        )
+        champdata.raise_for_status()
+        champdata = {
+            info["key"]: (info["name"], info["image"]["full"])
+            for info in champdata.json()["data"].values()
+        }
+        await loop.run_in_executor(None, self.save_data, ver, champdata)
+        await loop.run_in_executor(None, self.load_data, ver)
 
     async def get_summoner_by_name(
         self, name: str, region: str
     ) -> Union[str, "Summoner"]:
+        # Summoner names ignore case and spaces
+        key = (region.lower(), name.replace(" ", "").lower())
+        summoner = self.summoners.get(key)
+        if summoner is not None:
+            return summoner
         try:
-            data = await self.get_panth(region).getSummonerByName(name)
+            data = await self.call(region, "getSummonerByName", name)
         except KeyError:
             return "No such region"
         except NotFound:
             return "No such summoner"
-        return Summoner(data, region.lower())
+        summoner = self.summoners[key] = Summoner(data, region.lower())
+        return summoner
+
+    async def get_current_game(
+        self,
+        summoner_id: str,
+        region: str,
+        *,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Optional[Dict[str, Any]]:
+        # None if the summoner is not in a game
+        try:
+            return await self.call(
+                region, "getCurrentGame", summoner_id, priority=priority
+            )
+        except NotFound:
+            return None
 
 
 API: LoLAPI = None
@@ -110,4 +527,15 @@ if os.environ.get("rg_api_key"):
             "tr": "tr1",
             "ru": "ru",
         },
+        data_dir=os.environ.get("ddragon_cache_dir", ".ddragon"),
+        # e.g. "500:10,30000:600" for a production key
+        app_limits=[
+            (int(count), float(seconds))
+            for count, seconds in (
+                limit.split(":")
+                for limit in os.environ.get("rg_app_limits", "").split(",")
+                if limit
+            )
+        ]
+        or None,
     )
@@ -0,0 +1,80 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+
+from ...charts import init_worker, render_masteries, warm_up
+
+
+class RendererBusy(Exception):
+    pass
+
+
+class ChartRenderer:
+    """
+    Draws charts in a pool of worker processes so rendering never blocks the
+    event loop. Workers are spawned (not forked, as the bot runs threads) and
+    warmed up in the background when starting. At most `max_pending` charts
+    can be queued or drawing at once; beyond that `RendererBusy` is raised.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 16) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.warming: List[Future] = []
+
+    def start(self) -> None:
+        if self.executor is not None:
+            return
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+        )
+        # The pool only spawns a process when there is work waiting, so
+        # submit one warm up per worker
+        self.warming = [
+            self.executor.submit(warm_up) for _ in range(self.workers)
+        ]
+        for warming in self.warming:
+            warming.add_done_callback(self.warmed_up)
+
+    @staticmethod
+    def warmed_up(warming: Future) -> None:
+        if not warming.cancelled() and warming.exception() is not None:
+            print(f"Warming up chart renderer failed on {warming.exception()}")
+
+    async def wait_warm(self) -> None:
+        await asyncio.gather(
+            *(asyncio.wrap_future(warming) for warming in self.warming)
+        )
+
+    async def render_masteries(
+        self, names: List[str], points: List[int], title: str
+    ) -> bytes:
+        if self.pending >= self.max_pending:
+            raise RendererBusy("Too many charts are being drawn")
+        self.pending += 1
+        try:
+            self.start()
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, render_masteries, names, points, title
+            )
+        finally:
+            self.pending -= 1
+
+    async def close(self) -> None:
+        if self.executor is None:
+            return
+        executor, self.executor = self.executor, None
+        self.warming = []
+        # Waiting for the workers to exit blocks, so do it on a thread
+        await asyncio.get_running_loop().run_in_executor(
+            None, executor.shutdown
+        )
+
+
+RENDERER = ChartRenderer()
+
@@ -1,12 +1,20 @@
-import io
 import urllib.parse
-from typing import Sequence, TYPE_CHECKING, Any, Callable, Dict, Tuple, Union
+from typing import (
+    Sequence,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import discord
-import numpy as np
-from matplotlib import pyplot as plt
 
-from .query import API
+from .caches import RENDERS
+from .query import API, Summoner
+from .render import RENDERER, RendererBusy
 
 if TYPE_CHECKING:
     from .. import BotClient
@@ -28,30 +36,25 @@ def requires_rg_api(
 
 async def generate_visual(
     name: str, region: str
-) -> Tuple[bool, Union[str, io.BytesIO]]:
+) -> Tuple[bool, Union[str, bytes]]:
     summoner = await API.get_summoner_by_name(name, region)
     if isinstance(summoner, str):
         return False, summoner
+    await API.ensure_data(summoner.region)
+    key = RENDERS.key(summoner, API.game_version)
+    image_bytes = RENDERS.get_image(key)
+    if image_bytes is not None:
+        return True, image_bytes
     names, points = await summoner.get_masteries()
-
-    fig, ax = plt.subplots()
-
-    plt.barh(np.arange(len(names)), points)
-    plt.yticks(np.arange(len(names)), names)
-    plt.xlabel("Mastery Points")
-    plt.title(
-        f"Champion Mastery Points for {summoner.name} ({summoner.region})"
-    )
-
-    fig_size = plt.gcf().get_size_inches()
-    scale_factor = len(names) / 25
-    plt.gcf().set_size_inches(fig_size[0], fig_size[1] * max(1, scale_factor))
-
-    fig.tight_layout()
-
-    image_bytes = io.BytesIO()
-    plt.savefig(image_bytes, format="png")
-
+    try:
+        image_bytes = await RENDERER.render_masteries(
+            names,
+            points,
+            f"Champion Mastery Points for {summoner.name} ({summoner.region})",
+        )
+    except RendererBusy:
+        return False, "Too many charts are being drawn, try again later"
+    RENDERS.put_image(key, image_bytes)
     return True, image_bytes
 
 
@@ -59,12 +62,17 @@ async def generate_embed(name: str, region: str) -> discord.Embed:
     summoner = await API.get_summoner_by_name(name, region)
     if isinstance(summoner, str):
         return False, summoner
+    await API.ensure_data(summoner.region)
+    key = RENDERS.key(summoner, API.game_version)
+    embed_data = RENDERS.get_embed(key)
+    if embed_data is not None:
+        return True, discord.Embed.from_dict(embed_data)
     names, points = await summoner.get_masteries()
 
     # Sort decreasing
     names = names[::-1]
     points = points[::-1]
-    url_arg = urllib.parse.urlencode({"userName": name})
+    url_arg = urllib.parse.urlencode({"userName": summoner.name})
     points_sum = sum(points)
     subdomain = region.lower()
     subdomain = "www" if subdomain == "kr" else subdomain
@@ -74,7 +82,7 @@ async def generate_embed(name: str, region: str) -> discord.Embed:
         description=f"{summoner.name}\nMastery points: {points_sum}",
     )
     embed.set_thumbnail(url=summoner.profile_icon_url)
-    if names:
+    if names and names[0] in API.champion_images:
         embed.set_author(
             name=summoner.name,
             icon_url=(
@@ -88,13 +96,28 @@ async def generate_embed(name: str, region: str) -> discord.Embed:
         embed.add_field(
             name=n, value=f"{p}\n({(p / points_sum * 100):.1f}%)", inline=True
         )
+    RENDERS.put_embed(key, embed.to_dict())
     return True, embed
 
 
 async def get_game_info(
     name: str, region: str
-) -> Tuple[bool, Union[str, Dict[str, Any]]]:
+) -> Tuple[bool, Union[str, Tuple[Summoner, Optional[Dict[str, Any]]]]]:
     summoner = await API.get_summoner_by_name(name, region)
     if isinstance(summoner, str):
         return False, summoner
-    # TODO for another day
+    game = await API.get_current_game(summoner.id, summoner.region)
+    return True, (summoner, game)
+
+
+async def describe_game(
+    name: str, region: str, summoner_id: str, game: Dict[str, Any]
+) -> str:
+    mode = game["gameMode"].title()
+    for participant in game["participants"]:
+        if participant["summonerId"] != summoner_id:
+            continue
+        await API.ensure_data(region, [participant["championId"]])
+        champion = API.champion_name(participant["championId"])
+        return f"{name} is in a {mode} game playing {champion}"
+    return f"{name} is in a {mode} game"
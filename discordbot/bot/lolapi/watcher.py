@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .query import API, PRIORITY_BACKGROUND
+from .utils import describe_game
+
+# (region, summoner id)
+WatchKey = Tuple[str, str]
+
+
+class Watch:
+    __slots__ = (
+        "region",
+        "summoner_id",
+        "name",
+        "channels",
+        "game_id",
+        "interval",
+        "due",
+    )
+
+    def __init__(
+        self,
+        region: str,
+        summoner_id: str,
+        name: str,
+        game_id: Optional[int],
+    ) -> None:
+        self.region = region
+        self.summoner_id = summoner_id
+        self.name = name
+        # Channels to tell when the summoner starts or finishes a game
+        self.channels: Set[int] = set()
+        self.game_id = game_id
+        self.interval = 0.0
+        self.due = 0.0
+
+
+class GameWatcher:
+    """
+    Polls the spectator API for every watched summoner from a single task.
+    Summoners that are due are polled at background priority so user requests
+    go first, at most `batch_size` at once. Each poll runs on its own and is
+    given up after `poll_timeout` seconds, and notifications are sent in the
+    background, so a slow summoner or channel never holds back the others.
+    Summoners out of game are polled less and less often the longer they
+    stay out, down to `max_idle`.
+    """
+
+    def __init__(
+        self,
+        notify: Callable[[int, str], Awaitable[None]],
+        *,
+        batch_size: int = 50,
+        in_game_interval: float = 120.0,
+        min_idle: float = 60.0,
+        max_idle: float = 600.0,
+        backoff: float = 1.5,
+        poll_timeout: float = 30.0,
+    ) -> None:
+        self.notify = notify
+        self.batch_size = batch_size
+        self.in_game_interval = in_game_interval
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.backoff = backoff
+        self.poll_timeout = poll_timeout
+        self.watches: Dict[WatchKey, Watch] = {}
+        # Heap of (due, sequence, key); entries whose due time no longer
+        # matches the watch are stale and skipped
+        self.heap: List[Tuple[float, int, WatchKey]] = []
+        self.sequence = itertools.count()
+        # Created once running so they belong to the event loop
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.polling: Set[asyncio.Task] = set()
+        self.notifying: Set[asyncio.Task] = set()
+
+    def schedule(self, watch: Watch, interval: float) -> None:
+        watch.interval = interval
+        watch.due = time.monotonic() + interval
+        key = (watch.region, watch.summoner_id)
+        heapq.heappush(self.heap, (watch.due, next(self.sequence), key))
+
+    def add(
+        self,
+        region: str,
+        summoner_id: str,
+        name: str,
+        channel_id: int,
+        game_id: Optional[int],
+    ) -> bool:
+        # False if the channel is already watching the summoner
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        watch = self.watches.get((region, summoner_id))
+        if watch is None:
+            watch = Watch(region, summoner_id, name, game_id)
+            self.watches[(region, summoner_id)] = watch
+            in_game = game_id is not None
+            self.schedule(
+                watch, self.in_game_interval if in_game else self.min_idle
+            )
+            self.wakeup.set()
+        elif channel_id in watch.channels:
+            return False
+        watch.channels.add(channel_id)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run())
+        return True
+
+    def remove(self, region: str, summoner_id: str, channel_id: int) -> bool:
+        watch = self.watches.get((region, summoner_id))
+        if watch is None or channel_id not in watch.channels:
+            return False
+        watch.channels.discard(channel_id)
+        if not watch.channels:
+            del self.watches[(region, summoner_id)]
+        return True
+
+    async def run(self) -> None:
+        while self.watches:
+            self.wakeup.clear()
+            now = time.monotonic()
+            while (
+                self.heap
+                and self.heap[0][0] <= now
+                and len(self.polling) < self.batch_size
+            ):
+                due, _, key = heapq.heappop(self.heap)
+                watch = self.watches.get(key)
+                if watch is not None and watch.due == due:
+                    # The rate limiter spreads these out as needed
+                    polling = asyncio.ensure_future(self.poll(watch))
+                    self.polling.add(polling)
+                    polling.add_done_callback(self.polled)
+            if len(self.polling) >= self.batch_size:
+                # Woken up once a poll finishes
+                delay = self.max_idle
+            elif self.heap:
+                delay = self.heap[0][0] - now
+            else:
+                delay = self.max_idle
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def polled(self, polling: asyncio.Task) -> None:
+        self.polling.discard(polling)
+        self.wakeup.set()
+
+    async def poll(self, watch: Watch) -> None:
+        try:
+            game = await asyncio.wait_for(
+                API.get_current_game(
+                    watch.summoner_id,
+                    watch.region,
+                    priority=PRIORITY_BACKGROUND,
+                ),
+                self.poll_timeout,
+            )
+        except asyncio.TimeoutError:
+            print(f"Polling game of {watch.name} timed out")
+            self.schedule(watch, watch.interval)
+            return
+        except Exception as e:
+            print(f"Polling game of {watch.name} failed on {e}")
+            self.schedule(watch, watch.interval)
+            return
+        game_id = game["gameId"] if game is not None else None
+        if game_id is not None:
+            interval = self.in_game_interval
+        elif watch.game_id is not None:
+            interval = self.min_idle
+        else:
+            interval = min(watch.interval * self.backoff, self.max_idle)
+        changed = game_id != watch.game_id
+        watch.game_id = game_id
+        # The watch may have been removed while polling
+        if self.watches.get((watch.region, watch.summoner_id)) is not watch:
+            return
+        self.schedule(watch, interval)
+        if not changed:
+            return
+        notifying = asyncio.ensure_future(
+            self.announce(watch, game, list(watch.channels))
+        )
+        self.notifying.add(notifying)
+        notifying.add_done_callback(self.notifying.discard)
+
+    async def announce(
+        self, watch: Watch, game: Optional[dict], channels: List[int]
+    ) -> None:
+        try:
+            if game is not None:
+                content = await describe_game(
+                    watch.name, watch.region, watch.summoner_id, game
+                )
+            else:
+                content = f"{watch.name} has finished their game"
+        except Exception as e:
+            print(f"Describing game of {watch.name} failed on {e}")
+            return
+
+        async def send(channel_id: int) -> None:
+            try:
+                await self.notify(channel_id, content)
+            except Exception as e:
+                print(f"Game notification to {channel_id} failed on {e}")
+
+        await asyncio.gather(*(send(channel_id) for channel_id in channels))
+
+    def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for task in self.polling | self.notifying:
+            task.cancel()
@@ -3,74 +3,85 @@ import json
 import time
 from datetime import datetime, timezone
 from io import BytesIO, StringIO
-from typing import TYPE_CHECKING, Any, Sequence
+from typing import TYPE_CHECKING, Any, Dict, Sequence
 from zipfile import ZIP_DEFLATED, ZipFile
 
 import discord
 
 from ..routing import Endpoint
+from .pipeline import StageLatency, UploadStage, format_timings
 
 if TYPE_CHECKING:
     from .. import BotClient
 
 
-@Endpoint(checkmark_react=False, require_transaction=True)
+@Endpoint(checkmark_react=False)
 async def manage(
     self: "BotClient",
     message: discord.Message,
     groups: Sequence[str],
-    transaction: Any,
 ) -> None:
-    user, sentiment = await asyncio.gather(
-        self.db.get_user(message.author.id, transaction=transaction),
-        self.service.sentiment_analysis(message.content),
-    )
-    # Update user name e.g. "Puct#9551"
-    user.name = f"{message.author.name}#{message.author.discriminator}"
-    # Update user message history
-    # Make sure messages are sorted by timestamp; timestamps are in ISO format
-    # ISO format is YYYY-MM-DDTHH:MM:SS.mmmmmm+HH:MM. Time offsets are
-    # identical for all messages in the list.
-    # We can sort by timestamp lexicographically.
-    user.messages.sort(key=lambda x: x["timestamp"])
-    short_message = (
-        message.content
-        if len(message.content) <= 64
-        else message.content[:61] + "..."
-    )
-    user.messages.append(
-        {
-            "id": str(message.id),
-            "target": str(message.channel.id),
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "content": short_message,
-            "sentiment": sentiment,
-            "attachments": [f.filename for f in message.attachments],
-        },
-    )
-    if len(user.messages) > 10:
-        user.messages = user.messages[-10:]
-    await user.commit(transaction=transaction)
-
-    # Download, then upload attachments to cloud storage
-    download_coros = [attachment.read() for attachment in message.attachments]
-    datas = await asyncio.gather(*download_coros)
-    paths = [
-        f"{message.author.id}/{message.id}/attachments"
-        f"/{i}-{attachment.filename}"
-        for i, attachment in enumerate(message.attachments)
-    ]
-    # Also upload the message itself
-    paths.append(f"{message.author.id}/{message.id}/message.txt")
-    datas.append(message.content.encode("utf-8"))
-    await self.storage.upload(paths, datas)
-
-    # Message censoring
-    if user.censor_exempt:
+    latency = self.manage_latency
+    timings: Dict[str, float] = {}
+
+    # Message censoring goes first as it is cheap and deleted messages are
+    # not worth recording
+    with latency.measure("censor", timings):
+        censored = await self.db.censor_match(message.content) is not None
+        if censored:
+            user = await self.db.get_user(message.author.id)
+            censored = not user.censor_exempt
+    if censored:
+        await message.delete()
+        if self.log_pipeline_timings:
+            print(f"Pipeline: {format_timings(timings)}")
         return
-    for censor in await self.db.censor_list():
-        if censor in message.content:
-            await message.delete()
+
+    # Saving to storage happens in the background
+    with latency.measure("enqueue", timings):
+        await self.uploads.submit(message)
+
+    async def sentiment_analysis() -> float:
+        with latency.measure("sentiment", timings):
+            return await self.service.sentiment_analysis(message.content)
+
+    # Started once and shared should the transaction be retried
+    sentiment = asyncio.ensure_future(sentiment_analysis())
+
+    async def record(transaction: Any = None) -> None:
+        user = await self.db.get_user(
+            message.author.id, transaction=transaction
+        )
+        # Update user name e.g. "Puct#9551"
+        user.name = f"{message.author.name}#{message.author.discriminator}"
+        # Update user message history
+        short_message = (
+            message.content
+            if len(message.content) <= 64
+            else message.content[:61] + "..."
+        )
+        await self.db.add_user_message(
+            user,
+            {
+                "id": str(message.id),
+                "target": str(message.channel.id),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "content": short_message,
+                "sentiment": await asyncio.shield(sentiment),
+                "attachments": [f.filename for f in message.attachments],
+            },
+            transaction=transaction,
+        )
+
+    with latency.measure("db", timings):
+        if self.db.history_buffer is not None:
+            # Buffered message history is written in its own transaction
+            # when flushed, so there is nothing to do transactionally here
+            await record()
+        else:
+            await self.db.transactional(record)(self.db.transaction())
+    if self.log_pipeline_timings:
+        print(f"Pipeline: {format_timings(timings)}")
 
 
 @Endpoint()
@@ -87,16 +98,18 @@ async def user_data(
     )
 
     # Saved attachment data
-    files = await self.storage.ls(f"{message.author.id}/")
-    coros = [self.storage.read(path) for path in files]
+    paths = await self.storage.ls(f"{message.author.id}/")
+    # Deduplicated attachments are listed in manifests; export the files
+    files = await self.storage.expand_manifests(paths)
+    coros = [self.storage.read(path) for _, path in files]
     datas = await asyncio.gather(*coros)
     zip_data = BytesIO()
     with ZipFile(
         zip_data, "w", compression=ZIP_DEFLATED, compresslevel=5
     ) as fp:
         fp.writestr("data.json", data_str)
-        for path, data in zip(files, datas):
-            fp.writestr(path, data)
+        for (name, _), data in zip(files, datas):
+            fp.writestr(name, data)
 
     if zip_data.getbuffer().nbytes < 1024 * 1024 * 8:
         zip_data.seek(0)
@@ -0,0 +1,364 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import backoff
+import discord
+import httpx
+
+from ...backend.storage import BaseStorage
+from ...backend.storage.bases import MANIFEST
+from . import spool
+
+ATTACHMENTS = "/attachments/"
+
+
+class StageLatency:
+    """
+    Running latency figures of each stage of the message pipeline.
+    """
+
+    def __init__(self) -> None:
+        self.count: Dict[str, int] = {}
+        self.total: Dict[str, float] = {}
+        self.max: Dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.count[stage] = self.count.get(stage, 0) + 1
+        self.total[stage] = self.total.get(stage, 0.0) + seconds
+        self.max[stage] = max(self.max.get(stage, 0.0), seconds)
+
+    @contextmanager
+    def measure(self, stage: str, timings: Dict[str, float]) -> Iterator:
+        # Records the time taken into both the running figures and `timings`
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[stage] = time.perf_counter() - start
+            self.record(stage, timings[stage])
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {
+            stage: {
+                "count": count,
+                "mean": self.total[stage] / count,
+                "max": self.max[stage],
+            }
+            for stage, count in self.count.items()
+        }
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items()
+    )
+
+
+class UploadStage:
+    """
+    Saves message contents and attachments to storage in the background so
+    the message handler never waits on downloads or uploads. At most
+    `concurrency` messages are saved at once, each download and upload being
+    retried with exponential backoff. Nothing is dropped: messages arriving
+    while `max_pending` are already waiting, saves that keep failing and
+    whatever is left when closing go to a spool on local disk, which is
+    replayed every `replay_interval` seconds and on restart. Messages spooled
+    on arrival keep only their attachment URLs, so the handler never waits on
+    a download; the replay downloads them instead. With `dedupe`,
+    attachments are streamed into blobs stored once per distinct content
+    rather than downloaded whole and stored per message.
+    """
+
+    def __init__(
+        self,
+        storage: BaseStorage,
+        latency: StageLatency,
+        *,
+        spool_dir: str = ".upload_spool",
+        concurrency: int = 4,
+        max_pending: int = 256,
+        max_tries: int = 5,
+        replay_interval: float = 30.0,
+        dedupe: bool = False,
+    ) -> None:
+        self.storage = storage
+        self.latency = latency
+        self.spool_dir = spool_dir
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max_pending
+        self.max_tries = max_tries
+        self.replay_interval = replay_interval
+        self.dedupe = dedupe
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self.client: Optional[httpx.AsyncClient] = None
+        # Spool entries that are queued or being saved, resolved with
+        # whether saving them succeeded
+        self.replaying: Dict[str, asyncio.Future] = {}
+        # Doubles for every replay round that saves nothing (e.g. storage is
+        # down), up to 10 minutes
+        self.replay_delay = replay_interval
+        # Uploads that were being saved when closing, spooled by `close`
+        self.interrupted: List[Tuple[str, List[Tuple[str, Any]]]] = []
+        # Metrics
+        self.saved = 0
+        self.failed = 0
+        self.spooled = 0
+        self.replayed = 0
+
+    def start(self) -> None:
+        if self.workers:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Nothing is being spooled yet, so tidy up after any crash
+        spool.list_entries(self.spool_dir, clean=True)
+        self.queue = asyncio.Queue(self.max_pending)
+        self.workers = [
+            asyncio.ensure_future(self.work()) for _ in range(self.concurrency)
+        ]
+        self.workers.append(asyncio.ensure_future(self.replay()))
+
+    async def submit(self, message: discord.Message) -> None:
+        prefix = f"{message.author.id}/{message.id}"
+        uploads: List[Tuple[str, Any]] = [
+            (f"{prefix}{ATTACHMENTS}{i}-{attachment.filename}", attachment)
+            for i, attachment in enumerate(message.attachments)
+        ]
+        # Also upload the message itself
+        uploads.append((f"{prefix}/message.txt", message.content.encode()))
+        try:
+            self.queue.put_nowait((str(message.id), uploads, None))
+        except asyncio.QueueFull:
+            await self.spool_uploads(
+                str(message.id),
+                [
+                    (path, source.url)
+                    if isinstance(source, discord.Attachment)
+                    else (path, source)
+                    for path, source in uploads
+                ],
+            )
+
+    async def spoolable(
+        self, uploads: List[Tuple[str, Any]]
+    ) -> List[spool.Upload]:
+        # Attachment URLs expire and attachments go with deleted messages, so
+        # the data of attachments that failed to save is fetched before
+        # spooling. Only when that keeps failing is the URL spooled instead,
+        # as the last chance of saving it. URLs are spooled as they are.
+        async def fetch(path: str, source: Any) -> spool.Upload:
+            if isinstance(source, (bytes, str)):
+                return path, source
+            try:
+                return path, await self.retry(self.download)(source)
+            except Exception as e:
+                if isinstance(source, discord.Attachment):
+                    source = source.url
+                print(f"Fetching {path} failed on {e}, spooling its URL")
+                return path, source
+
+        return list(
+            await asyncio.gather(*(fetch(path, src) for path, src in uploads))
+        )
+
+    async def spool_uploads(
+        self, name: str, uploads: List[Tuple[str, Any]]
+    ) -> None:
+        entry = await self.spoolable(uploads)
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, spool.write_entry, self.spool_dir, name, entry
+            )
+        except OSError as e:
+            print(f"Spooling message {name} failed on {e}")
+            return
+        self.spooled += 1
+
+    async def download(self, source: Any) -> bytes:
+        if isinstance(source, bytes):
+            return source
+        if isinstance(source, discord.Attachment):
+            return await source.read()
+        # The URL of an attachment from the spool
+        if self.client is None:
+            self.client = httpx.AsyncClient()
+        response = await self.client.get(source)
+        response.raise_for_status()
+        return response.content
+
+    def retry(self, func: Callable[..., Awaitable[Any]]) -> Callable:
+        return backoff.on_exception(
+            backoff.expo, Exception, max_tries=self.max_tries, max_value=30
+        )(func)
+
+    async def save(self, uploads: List[Tuple[str, Any]]) -> None:
+        # Downloaded data replaces the sources as it comes in, so if the
+        # upload fails the downloads don't have to be repeated
+        async def download(i: int) -> None:
+            path, source = uploads[i]
+            uploads[i] = (path, await self.retry(self.download)(source))
+
+        await asyncio.gather(*(download(i) for i in range(len(uploads))))
+        await self.retry(self.storage.upload)(
+            [path for path, _ in uploads], [data for _, data in uploads]
+        )
+
+    async def stream(self, source: Any) -> AsyncIterator[bytes]:
+        if isinstance(source, bytes):
+            yield source
+            return
+        if isinstance(source, discord.Attachment):
+            source = source.url
+        if self.client is None:
+            self.client = httpx.AsyncClient()
+        async with self.client.stream("GET", source) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                yield chunk
+
+    async def save_deduplicated(self, uploads: List[Tuple[str, Any]]) -> None:
+        # Attachments are streamed into blobs named by their content, which
+        # are listed in a manifest kept with the message instead
+        async def put_blob(source: Any) -> Tuple[str, int]:
+            return await self.storage.put_blob(self.stream(source))
+
+        attachments = [
+            (path, source) for path, source in uploads if ATTACHMENTS in path
+        ]
+        blobs = await asyncio.gather(
+            *(self.retry(put_blob)(source) for _, source in attachments)
+        )
+        manifests: Dict[str, List[Dict[str, Any]]] = {}
+        for (path, _), (digest, size) in zip(attachments, blobs):
+            prefix, name = path.split(ATTACHMENTS, 1)
+            manifests.setdefault(prefix, []).append(
+                {
+                    "name": f"{ATTACHMENTS[1:]}{name}",
+                    "blob": digest,
+                    "size": size,
+                }
+            )
+        paths = [path for path, _ in uploads if ATTACHMENTS not in path]
+        datas = [data for path, data in uploads if ATTACHMENTS not in path]
+        for prefix, manifest in manifests.items():
+            paths.append(f"{prefix}/{MANIFEST}")
+            datas.append(json.dumps(manifest).encode())
+        await self.retry(self.storage.upload)(paths, datas)
+
+    async def work(self) -> None:
+        while True:
+            name, uploads, entry = await self.queue.get()
+            saved = False
+            try:
+                with self.latency.measure("upload", {}):
+                    if self.dedupe:
+                        await self.save_deduplicated(uploads)
+                    else:
+                        await self.save(uploads)
+                saved = True
+                self.saved += 1
+                if entry is not None:
+                    self.replayed += 1
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, spool.remove_entry, entry
+                    )
+            except asyncio.CancelledError:
+                # Closing; keep what was being saved for next time
+                if entry is None:
+                    self.interrupted.append((name, uploads))
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"Saving message {name} failed on {e}")
+                # Entries from the spool just stay there for the next replay
+                if entry is None:
+                    await self.spool_uploads(name, uploads)
+            finally:
+                if entry is not None:
+                    replaying = self.replaying.pop(entry, None)
+                    if replaying is not None and not replaying.done():
+                        replaying.set_result(saved)
+                self.queue.task_done()
+
+    async def replay(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            entries = await loop.run_in_executor(
+                None, spool.list_entries, self.spool_dir
+            )
+            round_: List[asyncio.Future] = []
+            for entry in entries:
+                if entry in self.replaying:
+                    continue
+                if self.queue.full():
+                    break
+                try:
+                    uploads = await loop.run_in_executor(
+                        None, spool.read_entry, entry
+                    )
+                except (OSError, ValueError) as e:
+                    print(f"Reading spooled {entry} failed on {e}")
+                    continue
+                self.replaying[entry] = loop.create_future()
+                round_.append(self.replaying[entry])
+                name = os.path.basename(entry)
+                self.queue.put_nowait((name, uploads, entry))
+            # Back off once per round in which nothing could be saved, so a
+            # single bad entry doesn't hold up the rest of the spool
+            results = await asyncio.gather(*round_)
+            if results and not any(results):
+                self.replay_delay = min(self.replay_delay * 2, 600.0)
+            else:
+                self.replay_delay = self.replay_interval
+            await asyncio.sleep(self.replay_delay)
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "saved": self.saved,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+        }
+
+    async def close(self, timeout: float = 10.0) -> None:
+        # Give queued uploads a chance to finish before stopping
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Spooling {self.depth} uploads on close")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        # Uploads cut off part way through are spooled along with the rest
+        interrupted, self.interrupted = self.interrupted, []
+        for name, uploads in interrupted:
+            await self.spool_uploads(name, uploads)
+        # Whatever is still queued is spooled; replayed entries are on disk
+        while self.queue is not None and not self.queue.empty():
+            name, uploads, entry = self.queue.get_nowait()
+            if entry is None:
+                await self.spool_uploads(name, uploads)
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import time
+from typing import List, Tuple, Union
+
+# Where the data of an upload comes from: the bytes themselves, or the URL of
+# an attachment that is yet to be downloaded
+Source = Union[bytes, str]
+# (storage path, source)
+Upload = Tuple[str, Source]
+
+MANIFEST = "manifest.json"
+
+
+def write_entry(spool_dir: str, name: str, uploads: List[Upload]) -> str:
+    """
+    Saves uploads to a new spool entry: a directory holding a manifest and a
+    file per upload that has its data. The directory is written under a
+    temporary name and renamed into place, so entries are never seen half
+    written.
+    """
+    entry = os.path.join(spool_dir, f"{time.time_ns()}-{name}")
+    tmp_entry = f"{entry}.tmp"
+    os.makedirs(tmp_entry, exist_ok=True)
+    manifest = []
+    for i, (path, source) in enumerate(uploads):
+        if isinstance(source, str):
+            manifest.append({"path": path, "url": source})
+            continue
+        with open(os.path.join(tmp_entry, str(i)), "wb") as fp:
+            fp.write(source)
+        manifest.append({"path": path, "file": str(i)})
+    with open(os.path.join(tmp_entry, MANIFEST), "w") as fp:
+        json.dump(manifest, fp)
+    os.replace(tmp_entry, entry)
+    return entry
+
+
+def read_entry(entry: str) -> List[Upload]:
+    with open(os.path.join(entry, MANIFEST)) as fp:
+        manifest = json.load(fp)
+    uploads: List[Upload] = []
+    for item in manifest:
+        if "url" in item:
+            uploads.append((item["path"], item["url"]))
+            continue
+        with open(os.path.join(entry, item["file"]), "rb") as fp:
+            uploads.append((item["path"], fp.read()))
+    return uploads
+
+
+def remove_entry(entry: str) -> None:
+    shutil.rmtree(entry, ignore_errors=True)
+
+
+def list_entries(spool_dir: str, *, clean: bool = False) -> List[str]:
+    # Oldest first. With `clean`, half written entries left behind by a
+    # crash are removed, so only do that when nothing is being written.
+    try:
+        names = sorted(os.listdir(spool_dir))
+    except OSError:
+        return []
+    entries = []
+    for name in names:
+        path = os.path.join(spool_dir, name)
+        if name.endswith(".tmp"):
+            if clean:
+                remove_entry(path)
+        elif os.path.isdir(path):
+            entries.append(path)
+    return entries
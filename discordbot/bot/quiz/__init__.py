@@ -1,5 +1,6 @@
 from ..routing import Pattern, RoutingList
 from . import endpoints
+from .sessions import QuizSession, QuizSessionManager
 
 PATTERNS = RoutingList(
     [
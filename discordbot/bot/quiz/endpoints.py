@@ -1,6 +1,5 @@
 import asyncio
 import random
-import time
 from typing import TYPE_CHECKING, Sequence
 
 import discord
@@ -23,13 +22,12 @@ async def quiz_subject_random(
     ]
     validate_symbol = chr(0x2611)  # U+2611 Check mark
     subject = groups[0]
-    quizzes = await self.db.quiz_list(subject)
-    if not quizzes:
+    quiz_name = await self.db.quiz_random(subject)
+    if quiz_name is None:
         await message.channel.send(
             "The subject cannot be found or there are no questions"
         )
         return
-    quiz_name = random.choice(quizzes)
     quiz = await self.db.get_quiz(subject, quiz_name)
     embed = discord.Embed(title="Question", description=quiz.question)
     if quiz.image:
@@ -49,35 +47,35 @@ async def quiz_subject_random(
     except Exception as e:
         print(f"Error on creating quiz question {quiz_name}")
         raise e
-    # Add reactions for user to click on
-    for i, _ in enumerate(quiz.options):
-        await emb_msg.add_reaction(character_emojis[i])
-    await emb_msg.add_reaction(validate_symbol)  # Check mark
+    # Listen for answers before adding the reactions so none are missed
+    session = self.quiz_sessions.start(emb_msg.id, validate_symbol)
+    # Add reactions for user to click on, in order and in the background
+    buttons = character_emojis[: len(quiz.options)] + [validate_symbol]
 
-    # Poll every few seconds to see if a user has answered (with timeout)
-    delay = 0
+    async def add_buttons() -> None:
+        for emoji in buttons:
+            await emb_msg.add_reaction(emoji)
+
+    adding = asyncio.ensure_future(add_buttons())
+    # Resolves as soon as someone presses the check mark (with timeout)
     quiz_timeout = 60
-    refresh_delay = 1
-    for _ in range((quiz_timeout - 1) // refresh_delay + 1):
-        # 1 - delay so we don't count the time of awaiting the message
-        await asyncio.sleep(1 - delay)
-        delay = time.time()
-        emb_msg = await message.channel.fetch_message(emb_msg.id)
-        stop_poll = False
-        for reaction in emb_msg.reactions:
-            emoji = reaction.emoji
-            stop_poll = emoji == validate_symbol and reaction.count > 1
-        if stop_poll:
-            break
-        delay = time.time() - delay
+    waiting = asyncio.ensure_future(session.wait(quiz_timeout))
+    try:
+        await asyncio.wait(
+            {adding, waiting}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if adding.done():
+            # Raises straight away if adding a reaction failed
+            adding.result()
+        await waiting
+        await adding
+    finally:
+        adding.cancel()
+        waiting.cancel()
+        self.quiz_sessions.end(emb_msg.id)
 
     # Validate answer
-    responses = [False] * len(quiz.options)
-    for reaction in emb_msg.reactions:
-        emoji = reaction.emoji
-        idx = ord(emoji) - regional_indicator_base
-        if 0 <= idx < len(quiz.options):
-            responses[idx] = reaction.count > 1
+    responses = session.responses(character_emojis[: len(quiz.options)])
     if not any(responses):
         embed.add_field(name="Result", value="No answer provided.")
         await emb_msg.edit(embed=embed)
@@ -0,0 +1,77 @@
+import asyncio
+from typing import Dict, List, Set
+
+import discord
+
+
+class QuizSession:
+    """
+    Reactions on a single quiz message, kept up to date from gateway events
+    so nobody has to fetch the message to find out who answered.
+    """
+
+    def __init__(self, message_id: int, validate_symbol: str) -> None:
+        self.message_id = message_id
+        self.validate_symbol = validate_symbol
+        # Emoji to the ids of the users that reacted with it
+        self.reactions: Dict[str, Set[int]] = {}
+        self.validated = asyncio.Event()
+
+    def add(self, emoji: str, user_id: int) -> None:
+        self.reactions.setdefault(emoji, set()).add(user_id)
+        if emoji == self.validate_symbol:
+            self.validated.set()
+
+    def remove(self, emoji: str, user_id: int) -> None:
+        self.reactions.get(emoji, set()).discard(user_id)
+
+    def clear(self) -> None:
+        self.reactions.clear()
+
+    async def wait(self, timeout: float) -> bool:
+        # True if the answer was validated before the timeout
+        try:
+            await asyncio.wait_for(self.validated.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def responses(self, emojis: List[str]) -> List[bool]:
+        return [bool(self.reactions.get(emoji)) for emoji in emojis]
+
+
+class QuizSessionManager:
+    """
+    Routes raw reaction events to the quiz session of the message they were
+    made on. Reactions from the bot itself should not be passed in.
+    """
+
+    def __init__(self) -> None:
+        self.sessions: Dict[int, QuizSession] = {}
+
+    def start(self, message_id: int, validate_symbol: str) -> QuizSession:
+        session = QuizSession(message_id, validate_symbol)
+        self.sessions[message_id] = session
+        return session
+
+    def end(self, message_id: int) -> None:
+        self.sessions.pop(message_id, None)
+
+    def on_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        session = self.sessions.get(payload.message_id)
+        if session is not None:
+            session.add(str(payload.emoji), payload.user_id)
+
+    def on_reaction_remove(
+        self, payload: discord.RawReactionActionEvent
+    ) -> None:
+        session = self.sessions.get(payload.message_id)
+        if session is not None:
+            session.remove(str(payload.emoji), payload.user_id)
+
+    def on_reaction_clear(
+        self, payload: discord.RawReactionClearEvent
+    ) -> None:
+        session = self.sessions.get(payload.message_id)
+        if session is not None:
+            session.clear()
@@ -4,9 +4,12 @@ from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
+    Dict,
     Generator,
     List,
     Match,
+    Optional,
+    Pattern as RegexPattern,
     Tuple,
     Union,
 )
@@ -94,19 +97,113 @@ class Pattern:
         self.match = match
         self.to = to
         self.description = description
+        # Compile once when the routing table is built rather than relying on
+        # the module level cache of `re` for every message
+        self.regex: RegexPattern[str] = re.compile(match)
+        self.prefix = literal_prefix(match)
 
     def do_match(self, content: str) -> Match[str]:
-        return re.match(self.match, content)
+        return self.regex.match(content)
+
+
+def literal_prefix(match: str) -> str:
+    """
+    Returns the literal text that any string matched by the regular expression
+    `match` (using `re.match`) must start with. The result is conservative; an
+    empty string is returned whenever the prefix cannot be determined cheaply.
+    """
+    # Top level alternations make the prefix optional, so give up
+    if _has_top_level_alternation(match):
+        return ""
+    i = 1 if match.startswith("^") else 0
+    prefix = ""
+    while i < len(match):
+        char = match[i]
+        if char == "\\":
+            if i + 1 >= len(match) or match[i + 1].isalnum():
+                # Character classes (\w, \d, ...) and anchors (\b, \A, ...)
+                break
+            char = match[i + 1]
+            i += 2
+        elif char in ".^$*+?{}[]()|":
+            break
+        else:
+            i += 1
+        # A quantifier following the character may make it optional
+        if i < len(match) and match[i] in "*?{":
+            break
+        prefix += char
+        if i < len(match) and match[i] == "+":
+            break
+    return prefix
+
+
+def _has_top_level_alternation(match: str) -> bool:
+    depth = 0
+    in_class = False
+    i = 0
+    while i < len(match):
+        char = match[i]
+        if char == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+            # A leading "]" (or "^]") is a literal inside the class
+            if match[i + 1 : i + 2] == "^":
+                i += 1
+            if match[i + 1 : i + 2] == "]":
+                i += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        i += 1
+    return False
+
+
+class _PrefixNode:
+    __slots__ = ("children", "indices")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_PrefixNode"] = {}
+        # Indices of patterns whose literal prefix ends at this node
+        self.indices: List[int] = []
 
 
 class RoutingList:
     def __init__(self, patterns: List[Pattern]) -> None:
         self.patterns = patterns
+        # Trie of literal prefixes so only patterns that can possibly match
+        # a message are tried. Most messages do not start with a command
+        # prefix and go straight to the catch-all pattern.
+        self._root = _PrefixNode()
+        for i, pattern in enumerate(patterns):
+            node = self._root
+            for char in pattern.prefix:
+                node = node.children.setdefault(char, _PrefixNode())
+            node.indices.append(i)
+
+    def candidates(self, content: str) -> List[Pattern]:
+        node: Optional[_PrefixNode] = self._root
+        indices = list(node.indices)
+        for char in content:
+            node = node.children.get(char)
+            if node is None:
+                break
+            indices.extend(node.indices)
+        # Keep the declaration order so the first match still wins
+        indices.sort()
+        return [self.patterns[i] for i in indices]
 
     def forward(
         self, message: discord.Message
     ) -> Tuple[List[Pattern], _EndpointCallable, Tuple[str]]:
-        for pattern in self.patterns:
+        for pattern in self.candidates(message.content):
             pattern_match = pattern.do_match(message.content)
             if pattern_match is None:
                 continue
@@ -129,3 +226,4 @@ class RoutingList:
                 yield pattern
             if isinstance(pattern.to, RoutingList):
                 yield from pattern.to.generate_leaf_patterns()
+
@@ -0,0 +1,55 @@
+"""
+Chart drawing run in the renderer's worker processes. Kept apart from the bot
+with no imports beyond the standard library, so spawned workers only load
+this module and matplotlib rather than the whole bot.
+"""
+import io
+from typing import Any, List
+
+# Set in each worker process by `init_worker` so matplotlib is only imported
+# once per process rather than once per chart
+Figure: Any = None
+
+
+def init_worker() -> None:
+    global Figure
+    import matplotlib
+
+    # Headless backend; figures are drawn straight to PNG
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure as _Figure
+
+    Figure = _Figure
+
+
+def warm_up() -> None:
+    # Draw a tiny chart so fonts and the like are loaded up front
+    render_masteries(["Warm up"], [1], "")
+
+
+def render_masteries(names: List[str], points: List[int], title: str) -> bytes:
+    """
+    Horizontal bar chart of champion mastery points as PNG bytes. Uses the
+    object oriented API instead of pyplot, so there is no global figure state
+    and the figure is freed as soon as it goes out of scope.
+    """
+    if Figure is None:
+        init_worker()
+    fig = Figure()
+    ax = fig.add_subplot()
+    positions = list(range(len(names)))
+    ax.barh(positions, points)
+    ax.set_yticks(positions)
+    ax.set_yticklabels(names)
+    ax.set_xlabel("Mastery Points")
+    ax.set_title(title)
+
+    fig_size = fig.get_size_inches()
+    scale_factor = len(names) / 25
+    fig.set_size_inches(fig_size[0], fig_size[1] * max(1, scale_factor))
+
+    fig.tight_layout()
+
+    image_bytes = io.BytesIO()
+    fig.savefig(image_bytes, format="png")
+    return image_bytes.getvalue()
@@ -1,11 +1,42 @@
 import os
 
-from discordbot import BotClient
-from discordbot.backend.db import FirestoreDB
-from discordbot.backend.services import GCPService
-from discordbot.backend.storage import GCSBucket
-
 if __name__ == "__main__":
+    # Imported here as spawned worker processes re-run this module and should
+    # not load the bot
+    from discordbot import BotClient
+    from discordbot.backend.db import FirestoreDB, MemoryDB, SQLiteDB
+    from discordbot.backend.services import GCPService
+    from discordbot.backend.storage import GCSBucket
+
     token = os.environ.get("discord_token")
-    client = BotClient(FirestoreDB, GCPService, GCSBucket)
+    db_options = {}
+    # Firestore unless another database backend is selected
+    db_type = {"memory": MemoryDB, "sqlite": SQLiteDB}.get(
+        os.environ.get("db_backend"), FirestoreDB
+    )
+    if db_type is SQLiteDB and os.environ.get("sqlite_path"):
+        db_options["path"] = os.environ.get("sqlite_path")
+    if db_type is FirestoreDB and os.environ.get("quiz_prefetch"):
+        # Comma separated quiz subjects to load at startup
+        subjects = os.environ.get("quiz_prefetch")
+        db_options["quiz_prefetch"] = subjects.split(",")
+    # Opt in to buffering message history writes (seconds of staleness)
+    if os.environ.get("history_max_staleness"):
+        db_options["history_max_staleness"] = float(
+            os.environ.get("history_max_staleness")
+        )
+    client = BotClient(
+        db_type,
+        GCPService,
+        GCSBucket,
+        db_options=db_options,
+        # Overlay soundboard clips instead of queueing them
+        soundboard_mix=bool(os.environ.get("soundboard_mix")),
+        # Uploads that could not be saved yet are kept here
+        upload_spool_dir=os.environ.get("upload_spool_dir", ".upload_spool"),
+        # Store each distinct attachment once, by its content hash
+        dedupe_attachments=bool(os.environ.get("dedupe_attachments")),
+        # Print per message timings of the message pipeline
+        log_pipeline_timings=bool(os.environ.get("pipeline_timings")),
+    )
     client.run(token)
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Dict, List
+
+from google.cloud.firestore import ArrayRemove, ArrayUnion
+
+from discordbot.backend.db.bases import UserBase
+from discordbot.backend.db.firestore.dtypes import User
+
+
+class FakeTransaction:
+    def __init__(self) -> None:
+        self.updates: List[Dict[str, Any]] = []
+
+    def update(self, ref: Any, data: Dict[str, Any]) -> None:
+        self.updates.append(data)
+
+
+def message(i: int) -> Dict[str, Any]:
+    return {"timestamp": f"2021-01-01T00:00:{i:02}.000000+00:00", "n": i}
+
+
+def full_user() -> User:
+    messages = [message(i) for i in range(UserBase.HISTORY_LENGTH)]
+    return User({"id": "1", "messages": messages}, None)
+
+
+def test_full_history_appends_without_rewriting() -> None:
+    user = full_user()
+    user.add_messages([message(50)])
+    updates = user.cm.update()
+    assert len(updates) == 2
+    removed, added = updates[0]["messages"], updates[1]["messages"]
+    assert isinstance(removed, ArrayRemove)
+    assert isinstance(added, ArrayUnion)
+
+
+def test_full_history_commit_in_transaction() -> None:
+    user = full_user()
+    user.add_messages([message(50), message(51)])
+    transaction = FakeTransaction()
+    asyncio.run(user.cm.commit(transaction=transaction))
+    assert [list(update) for update in transaction.updates] == [
+        ["messages"],
+        ["messages"],
+    ]
+    assert isinstance(transaction.updates[0]["messages"], ArrayRemove)
+    assert isinstance(transaction.updates[1]["messages"], ArrayUnion)
+    assert len(user.messages) == UserBase.HISTORY_LENGTH
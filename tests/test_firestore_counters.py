@@ -0,0 +1,140 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+from discordbot.backend.db.firestore.fsdb import FirestoreDB
+
+
+class ReadAfterWriteError(Exception):
+    pass
+
+
+class FakeTransaction:
+    # Like Firestore, refuses to read once anything has been written
+    def __init__(self) -> None:
+        self.writes: List[Tuple[str, str, Any]] = []
+
+    def check_read(self) -> None:
+        if self.writes:
+            raise ReadAfterWriteError("Read after write in a transaction")
+
+    def set(self, ref: "FakeDocument", data: Any, merge: bool = False) -> None:
+        self.writes.append(("set", ref.path, data))
+
+    def update(self, ref: "FakeDocument", data: Any) -> None:
+        self.writes.append(("update", ref.path, data))
+
+
+class FakeSnapshot:
+    def __init__(self, ref: "FakeDocument", data: Optional[Dict]) -> None:
+        self.id = ref.id
+        self.reference = ref
+        self.data = data
+
+    def to_dict(self) -> Optional[Dict]:
+        return None if self.data is None else dict(self.data)
+
+
+class FakeDocument:
+    def __init__(self, store: Dict[str, Dict], path: str) -> None:
+        self.store = store
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self.store, f"{self.path}/{name}")
+
+
+class FakeCollection:
+    def __init__(self, store: Dict[str, Dict], path: str) -> None:
+        self.store = store
+        self.path = path
+        self.created = 0
+        self.name: Optional[str] = None
+
+    def document(self, document_id: Optional[str] = None) -> FakeDocument:
+        if document_id is None:
+            self.created += 1
+            document_id = f"new{self.created}"
+        return FakeDocument(self.store, f"{self.path}/{document_id}")
+
+    def where(self, field: str, op: str, value: Any) -> "FakeCollection":
+        self.name = value
+        return self
+
+    def limit(self, count: int) -> "FakeCollection":
+        return self
+
+    async def get(self, transaction: FakeTransaction) -> List[FakeSnapshot]:
+        transaction.check_read()
+        return [
+            FakeSnapshot(FakeDocument(self.store, path), data)
+            for path, data in self.store.items()
+            if path.count("/") == 1 and data.get("name") == self.name
+        ]
+
+
+class FakeClient:
+    def __init__(self, store: Dict[str, Dict]) -> None:
+        self.store = store
+
+    async def get_all(
+        self, refs: List[FakeDocument], transaction: FakeTransaction = None
+    ):
+        if transaction is not None:
+            transaction.check_read()
+        for ref in refs:
+            yield FakeSnapshot(ref, self.store.get(ref.path))
+
+
+def make_db(store: Dict[str, Dict]) -> FirestoreDB:
+    # Only what counters need, without connecting to Firestore
+    db = FirestoreDB.__new__(FirestoreDB)
+    db.db = FakeClient(store)
+    db.counters = FakeCollection(store, "counters")
+    db.counter_ids = {}
+    db.counter_totals = TTLCache(16, 60)
+    db.counter_shards = 4
+    db.transaction = FakeTransaction
+    db.transactional = lambda func: func
+    return db
+
+
+def test_new_counter_reads_before_writing() -> None:
+    db = make_db({})
+    counter = asyncio.run(db.get_counter("new"))
+    assert counter.value == 0
+    assert db.counter_ids["new"] == ("new1", 4)
+
+
+def test_new_counter_in_transaction() -> None:
+    db = make_db({})
+    transaction = FakeTransaction()
+    counter = asyncio.run(db.get_counter("new", transaction=transaction))
+    assert counter.value == 0
+    assert transaction.writes == [
+        ("set", "counters/new1", {"name": "new", "shards": 4})
+    ]
+
+
+def test_legacy_counter_migrates() -> None:
+    db = make_db(
+        {
+            "counters/old": {"name": "old", "value": 5, "shards": 2},
+            "counters/old/shards/1": {"value": 2},
+        }
+    )
+    transaction = FakeTransaction()
+    counter = asyncio.run(db.get_counter("old", transaction=transaction))
+    assert counter.value == 7
+    assert counter.shard_values == [5, 2]
+    assert [(kind, path) for kind, path, _ in transaction.writes] == [
+        ("set", "counters/old/shards/0"),
+        ("update", "counters/old"),
+    ]
+    # Cached once the lookup transaction commits
+    assert "old" not in db.counter_ids
+    asyncio.run(db.get_counter("old"))
+    assert db.counter_ids["old"] == ("old", 2)
+